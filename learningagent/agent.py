@@ -1,23 +1,327 @@
+import collections.abc
+
+import numpy as np
+
 from learningagent import agent_percepts as percepts
 
 class State():
+    """
+    Immutable pairing of a location with the agent's certainty of being there.
+    """
+    __slots__ = ('location', 'certainty', '_hash')
+
     def __init__(self, location, certainty):
-        self.location = location
-        self.certainty = certainty
+        object.__setattr__(self, 'location', location)
+        object.__setattr__(self, 'certainty', certainty)
+        object.__setattr__(self, '_hash', hash((location, certainty)))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('State is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('State is immutable')
+
+    def __reduce__(self):
+        return (State, (self.location, self.certainty))
 
     def __repr__(self):
         return '({}, {})'.format(self.location, self.certainty)
 
     def __eq__(self, other):
-        return (self.location == other.location
-                and self.certainty == other.certainty)
+        try:
+            return (self.location == other.location
+                    and self.certainty == other.certainty)
+        except AttributeError:
+            return NotImplemented
+
+    def __hash__(self):
+        return self._hash
+
+
+class CostTable(collections.abc.MutableMapping):
+    """
+    Mapping for the agent's LRTA* tables which counts the changes made to
+    it, so values computed from the table can be cached until it changes.
+    Storing a value equal to the one already stored is not a change.
+    """
+
+    def __init__(self, entries=()):
+        self._entries = {}
+        self.version = 0
+        self.update(entries)
+        self.version = 0
+
+    def __getitem__(self, key):
+        return self._entries[key]
+
+    def __setitem__(self, key, value):
+        try:
+            if self[key] == value:
+                return
+        except KeyError:
+            pass
+
+        self._store(key, value)
+        self.version += 1
+
+    def __delitem__(self, key):
+        self._discard(key)
+        self.version += 1
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, dict(self))
+
+    def __reduce__(self):
+        return (type(self), (dict(self), ))
+
+    def _store(self, key, value):
+        self._entries[key] = value
+
+    def _discard(self, key):
+        del self._entries[key]
+
+
+class CostEstimates(CostTable):
+    """
+    Cost estimate table which keeps the estimates for the vertices of a
+    visibility graph in a float64 array indexed by vertex id, with NaN
+    where there is no estimate. Estimates for other states go in a dict.
+    """
+
+    def __init__(self, graph, entries=()):
+        self.graph = graph
+        self.values = np.full(len(graph), np.nan)
+        self._count = 0
+        super().__init__(entries)
+
+    def __getitem__(self, key):
+        i = self.graph.vertex_id(key)
+
+        if i is None:
+            return self._entries[key]
+
+        value = self.values[i]
+
+        if value != value:
+            raise KeyError(key)
+
+        return float(value)
+
+    def __iter__(self):
+        for i in np.flatnonzero(~np.isnan(self.values)):
+            yield self.graph.vertices[i]
+
+        yield from self._entries
+
+    def __len__(self):
+        return self._count + len(self._entries)
+
+    def __reduce__(self):
+        return (type(self), (self.graph, dict(self)))
+
+    def _store(self, key, value):
+        i = self.graph.vertex_id(key)
+
+        if i is None:
+            self._entries[key] = value
+            return
+
+        if self.values[i] != self.values[i]:
+            self._count += 1
+
+        self.values[i] = value
+
+    def _discard(self, key):
+        i = self.graph.vertex_id(key)
+
+        if i is None:
+            del self._entries[key]
+            return
+
+        if self.values[i] != self.values[i]:
+            raise KeyError(key)
+
+        self.values[i] = np.nan
+        self._count -= 1
+
+
+class ResultTable(CostTable):
+    """
+    Result table which keeps the outcome of moving along an edge of a
+    visibility graph as a vertex id in an int32 array aligned with the
+    graph's compressed adjacency, with -1 where there is no entry.
+    Entries for other moves, or moves ending away from a vertex, go in a
+    dict, and self.row_entries counts how many of those start at each
+    vertex.
+    """
+
+    def __init__(self, graph, entries=()):
+        self.graph = graph
+        self.states = np.full(len(graph.targets), -1, dtype=np.int32)
+        self.row_entries = np.zeros(len(graph), dtype=np.intp)
+        self._count = 0
+        super().__init__(entries)
+
+    def _slot(self, key):
+        """
+        Given a (state, action) key, return the vertex id of the state and
+        the key's slot in self.states, or (None, None) if it has no slot.
+        """
+        try:
+            s, action = key
+        except (TypeError, ValueError):
+            return None, None
+
+        i = self.graph.vertex_id(s)
+        j = self.graph.vertex_id(action)
+
+        if i is None or j is None:
+            return None, None
+
+        return i, self.graph.edge_slot(i, j)
+
+    def __getitem__(self, key):
+        i, slot = self._slot(key)
+
+        if slot is not None and self.states[slot] >= 0:
+            return self.graph.vertices[self.states[slot]]
+
+        return self._entries[key]
+
+    def __iter__(self):
+        for slot in np.flatnonzero(self.states >= 0):
+            i = np.searchsorted(self.graph.offsets, slot, side='right') - 1
+            yield (self.graph.vertices[i],
+                   self.graph.vertices[self.graph.targets[slot]])
+
+        yield from self._entries
+
+    def __len__(self):
+        return self._count + len(self._entries)
+
+    def __reduce__(self):
+        return (type(self), (self.graph, dict(self)))
+
+    def _store(self, key, value):
+        i, slot = self._slot(key)
+        state = None if slot is None else self.graph.vertex_id(value)
+
+        if state is None:
+            if key in self._entries:
+                self._entries[key] = value
+                return
+
+            if slot is not None:
+                self._clear_slot(slot)
+                self.row_entries[i] += 1
+
+            self._entries[key] = value
+            return
+
+        if key in self._entries:
+            del self._entries[key]
+            self.row_entries[i] -= 1
+
+        if self.states[slot] < 0:
+            self._count += 1
+
+        self.states[slot] = state
+
+    def _discard(self, key):
+        i, slot = self._slot(key)
+
+        if key in self._entries:
+            del self._entries[key]
+            if slot is not None:
+                self.row_entries[i] -= 1
+        elif slot is not None and self.states[slot] >= 0:
+            self._clear_slot(slot)
+        else:
+            raise KeyError(key)
+
+    def _clear_slot(self, slot):
+        if self.states[slot] >= 0:
+            self.states[slot] = -1
+            self._count -= 1
+
+
+class ActionCostCache():
+    """
+    Cache of the LRTA* cost of taking an action from a state. The cached
+    costs are only valid for one version of the result and cost estimate
+    tables and one goal, so the cache is emptied as soon as any of them
+    change.
+    """
+
+    def __init__(self):
+        self.tables = None
+        self.key = None
+        self.costs = {}
+
+    def costs_for(self, result, cost_estimates, goal):
+        """
+        Given the tables and the goal, return the dict of cached costs,
+        keyed by (state, action), which is valid for them.
+        """
+        key = (result.version, cost_estimates.version, goal)
+
+        if (self.tables is None or self.tables[0] is not result
+            or self.tables[1] is not cost_estimates or self.key != key):
+            self.tables = (result, cost_estimates)
+            self.key = key
+            self.costs = {}
+
+        return self.costs
+
+
+def _cost_table(name, table_class):
+    """
+    Return a property storing a CostTable, which converts mappings
+    assigned to it into a table_class over the agent's visibility graph,
+    or a plain CostTable if the agent has no obstacles. Assigning a
+    CostTable keeps it as is, so several attributes can share one table.
+    """
+    attribute = '_' + name
+
+    def get(self):
+        return getattr(self, attribute)
+
+    def set(self, table):
+        if not isinstance(table, CostTable):
+            if self.graph is None:
+                table = CostTable(table)
+            else:
+                table = table_class(self.graph, table)
+        setattr(self, attribute, table)
+
+    return property(get, set)
 
 
 class Agent():
-    def __init__(self, goal, belief_state, visible_obstacles):
+    result = _cost_table('result', ResultTable)
+    cost_estimates = _cost_table('cost_estimates', CostEstimates)
+    prev_result = _cost_table('prev_result', ResultTable)
+    prev_cost_estimates = _cost_table('prev_cost_estimates', CostEstimates)
+
+    def __init__(self, goal, belief_state, visible_obstacles,
+                 exact_heuristic=False):
         self.goal = goal
         self.belief_state = belief_state
         self.visible_obstacles = visible_obstacles
+        # LRTA* tables store vertices by their id in this graph
+        if visible_obstacles is None:
+            self.graph = None
+            self.distances = None
+        else:
+            self.graph = percepts.action_graph(visible_obstacles)
+            # Distances between the graph's vertices, indexed by vertex id
+            self.distances = percepts.action_distances(visible_obstacles)
         # a table indexed by state and action
         self.result = {}
         # a table of cost estimates index by state
@@ -29,6 +333,11 @@ class Agent():
         self.score = 0
         self.reached_goal = False
         self.belief_history = []
+        self.action_cost_cache = ActionCostCache()
+        # Seed cost estimates with shortest path lengths around the
+        # obstacles rather than straight-line distances, and use them to
+        # cost actions which haven't been tried yet
+        self.exact_heuristic = exact_heuristic
 
 
     @staticmethod
@@ -43,6 +352,18 @@ class Agent():
                     + cost_estimates[state])
 
 
+    def heuristic(self, p):
+        """
+        Given a point p, return the initial estimate of the cost of reaching
+        the goal from p.
+        """
+        if self.exact_heuristic and self.visible_obstacles is not None:
+            return percepts.shortest_path_heuristic(p, self.goal,
+                                                    self.visible_obstacles)
+
+        return percepts.heuristic(p, self.goal)
+
+
     def goal_test(self, p):
         """
         Give a position p and a goal point, determine if there is an unblocked
@@ -51,18 +372,134 @@ class Agent():
         return p == self.goal
 
 
-    def best_actions(self, s, action_cost):
+    def action_costs(self, s, result, cost_estimates, origin=None):
+        """
+        Given a state s and the result and cost estimate tables, return a
+        list of (action, cost) pairs for the actions from s, in the order
+        of percepts.actions. Costs are measured from origin, which defaults
+        to s, and are cached until the tables change.
+        """
+        if origin is None:
+            origin = s
+
+        cache = self.action_cost_cache.costs_for(result, cost_estimates,
+                                                 self.goal)
+        costs = []
+
+        for action in percepts.actions(s, self.visible_obstacles):
+            key = (origin, action)
+
+            if key not in cache:
+                state = result.get(key)
+
+                if state is None and self.exact_heuristic:
+                    # Expect the action to reach its destination, and
+                    # estimate the cost from there
+                    estimate = cost_estimates.get(action)
+                    if estimate is None:
+                        estimate = self.heuristic(action)
+                    cache[key] = (percepts.actual_cost(origin, action, action)
+                                  + estimate)
+                else:
+                    cache[key] = self.LRTA_star_cost(
+                        origin, action, state, cost_estimates, self.goal)
+
+            costs.append((action, cache[key]))
+
+        return costs
+
+
+    def row_costs(self, s, result, cost_estimates):
+        """
+        Given a vertex s and the result and cost estimate tables, return a
+        pair of arrays: the vertex ids of the actions from s, in the order
+        of percepts.actions, and their costs. Returns None if the costs
+        can't be read straight from array-backed tables, in which case
+        action_costs should be used instead.
+        """
+        graph = self.graph
+
+        if (graph is None
+            or not isinstance(result, ResultTable) or result.graph is not graph
+            or not isinstance(cost_estimates, CostEstimates)
+            or cost_estimates.graph is not graph
+            or percepts.action_graph(self.visible_obstacles) is not graph):
+            return None
+
+        i = graph.vertex_id(s)
+
+        if i is None or result.row_entries[i]:
+            return None
+
+        start, end = graph.offsets[i], graph.offsets[i + 1]
+
+        if start == end:
+            return None
+
+        targets = graph.targets[start:end]
+        states = result.states[start:end]
+        reached = states >= 0
+
+        if self.exact_heuristic:
+            # Untried actions are costed from where they lead, as in
+            # action_costs
+            destinations = np.where(reached, states, targets)
+        else:
+            destinations = states[reached]
+
+        estimates = cost_estimates.values[destinations]
+
+        if self.exact_heuristic:
+            untried = ~reached & np.isnan(estimates)
+            estimates[untried] = self._exact_heuristics(destinations[untried])
+
+        if np.isnan(estimates).any():
+            # A missing estimate, let action_costs raise the KeyError
+            return None
+
+        if self.distances is not None:
+            distances = self.distances.matrix[i, destinations].astype(np.float64)
+        else:
+            distances = np.sqrt((graph.points.x[destinations] - s.x)**2
+                                + (graph.points.y[destinations] - s.y)**2)
+
+        if self.exact_heuristic:
+            return targets, distances + estimates
+
+        costs = np.full(end - start, percepts.heuristic(s, self.goal))
+        costs[reached] = distances + estimates
+
+        return targets, costs
+
+
+    def _exact_heuristics(self, ids):
+        """
+        Given an array of vertex ids, return the array of their exact
+        heuristics, as self.heuristic would give them.
+        """
+        goal_distances = percepts.goal_database(
+            self.visible_obstacles).goal_distances(self.goal)
+        distances = goal_distances.distances[ids]
+        # Vertices the goal can't be reached from use the straight line
+        straight = np.sqrt((self.goal.x - self.graph.points.x[ids])**2
+                           + (self.goal.y - self.graph.points.y[ids])**2)
+
+        return np.where(np.isinf(distances), straight, distances)
+
+
+    def best_actions(self, s, result, cost_estimates, origin=None):
         """
-        Given a state s and a cost function action_cost, return the actions with
-        the lowest cost.
+        Given a state s and the result and cost estimate tables, return the
+        actions from s with the lowest cost from origin.
         """
-        actions_from_s = sorted([action for action in percepts.actions(s)],
-                                key=action_cost)
+        costs = self.action_costs(s, result, cost_estimates, origin)
 
-        best_actions_from_s = [v for v in actions_from_s
-                               if action_cost(v) == action_cost(actions_from_s[0])]
+        if not costs:
+            return []
 
-        return best_actions_from_s
+        lowest = min(cost for action, cost in costs)
+
+        return [action for action, cost in costs if cost == lowest]
 
 
     def _prev_prob(self, a):
@@ -70,24 +507,23 @@ class Agent():
         Given that agent is currently at A, return the
         probability that the agent was previously at prev_state.
         """
-        def action_cost(action):
-            return self.LRTA_star_cost(
-                self.prev_state.location,
-                action,
-                self.prev_result.get((self.prev_state.location, action)),
-                self.prev_cost_estimates,
-                self.goal)
-
+        graph = percepts.visibility_graph(self.visible_obstacles)
         visible_from_a = percepts.visible_vertices(a, self.visible_obstacles)
 
-        best_actions_prev = self.best_actions(self.prev_state.location, action_cost)
+        best_actions_prev = self.best_actions(self.prev_state.location,
+                                              self.prev_result,
+                                              self.prev_cost_estimates)
 
-        if (self.prev_state.location in visible_from_a
+        if (graph.vertex_visible(a, self.prev_state.location)
             and a in best_actions_prev):
             # Only consider vertices visible from A which have
             # A as one of the lowest values for lrta_star_cost
+            # Actions are costed from prev_state, so they share the costs
+            # cached for best_actions_prev.
             best_actions_v = [v for v in visible_from_a
-                              if a in self.best_actions(v, action_cost)]
+                              if a in self.best_actions(
+                                  v, self.prev_result, self.prev_cost_estimates,
+                                  self.prev_state.location)]
 
             if len(best_actions_v) == 0:
                 return 0
@@ -102,14 +538,9 @@ class Agent():
         Given that the agent was previously in prev_state, return the
         probability that the agent is currently in state a.
         """
-        a_locations = len(percepts.get_locations(
-            percepts.visible_vertices(a, self.visible_obstacles),
-            self.visible_obstacles))
-
-        b_locations = len(percepts.get_locations(
-            percepts.visible_vertices(self.prev_state.location,
-                                      self.visible_obstacles),
-            self.visible_obstacles))
+        a_locations = percepts.ambiguity_count(a, self.visible_obstacles)
+        b_locations = percepts.ambiguity_count(self.prev_state.location,
+                                               self.visible_obstacles)
 
         p_of_a = 1 / a_locations
         p_of_b = 1 / b_locations
@@ -243,32 +674,31 @@ class Agent():
             return
 
         if loc not in self.cost_estimates:
-            self.cost_estimates[loc] = percepts.heuristic(loc, self.goal)
+            self.cost_estimates[loc] = self.heuristic(loc)
 
         if self.prev_state.location:
             self.result[(prev_loc, self.prev_action)] = loc
 
-            self.cost_estimates[prev_loc] = min(
-                [self.LRTA_star_cost(
-                    prev_loc,
-                    action,
-                    self.result.get((prev_loc, action)),
-                    self.cost_estimates,
-                    self.goal)
-                for action in percepts.actions(prev_loc)])
-
-        def lrta_action_cost(action):
-            return self.LRTA_star_cost(
-                loc,
-                action,
-                self.result.get((loc, action)),
-                self.cost_estimates,
-                self.goal)
-
-        if percepts.line_is_unblocked(loc, self.goal, self.visible_obstacles):
+            row = self.row_costs(prev_loc, self.result, self.cost_estimates)
+
+            if row is not None:
+                self.cost_estimates[prev_loc] = float(row[1].min())
+            else:
+                self.cost_estimates[prev_loc] = min(
+                    [cost for action, cost in self.action_costs(
+                        prev_loc, self.result, self.cost_estimates)])
+
+        if percepts.goal_visible(loc, self.goal, self.visible_obstacles):
             self.prev_action = self.goal
         else:
-            self.prev_action = min([action for action in percepts.actions(loc)],
-                                   key=lrta_action_cost)
+            row = self.row_costs(loc, self.result, self.cost_estimates)
+
+            if row is not None:
+                # argmin picks the first lowest cost, as min() does
+                self.prev_action = self.graph.vertices[row[0][row[1].argmin()]]
+            else:
+                self.prev_action = min(
+                    self.action_costs(loc, self.result, self.cost_estimates),
+                    key=lambda action_cost: action_cost[1])[0]
 
         self.prev_state = self.belief_state
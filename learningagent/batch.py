@@ -0,0 +1,237 @@
+# Module to run many simulations at once across a pool of processes, and
+# summarise their results.
+
+import argparse
+import ast
+import collections
+import concurrent.futures
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+from learningagent import geometry_helpers as geom
+from learningagent import environment_details as env
+from learningagent import agent_percepts as percepts
+from learningagent import simulation
+from learningagent import events
+from learningagent import shared_environment
+
+# One simulation to run. The agent's new starting points after reaching the
+# goal are drawn from a random.Random seeded with seed, so a scenario gives
+# the same result in any worker.
+Scenario = collections.namedtuple('Scenario', ['start', 'goal', 'turns',
+                                               'reward', 'seed'])
+
+# Result of running scenario number index, with the time it took in seconds
+EpisodeResult = collections.namedtuple('EpisodeResult', [
+    'index', 'scenario', 'score', 'turns', 'goals_reached', 'first_goal_turn',
+    'wall_time'])
+
+# Environment attached by each worker process, or None for the default maze
+_worker_environment = None
+
+
+def read_scenarios(f):
+    """
+    Given an open file with one JSON object per line, return a list of
+    Scenarios. Each object has "start" and "goal" as [x, y] pairs and
+    optionally "turns", "reward" and "seed"; seeds default to the line's
+    position in the file.
+    """
+    scenarios = []
+
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+
+        fields = json.loads(line)
+        scenarios.append(Scenario(geom.Point(*fields['start']),
+                                  geom.Point(*fields['goal']),
+                                  fields.get('turns', 250),
+                                  fields.get('reward', 1000),
+                                  fields.get('seed', len(scenarios))))
+
+    return scenarios
+
+
+def scenario_grid(starts, goals, turns=250, reward=1000, repeats=1, seed=0):
+    """
+    Given lists of start and goal points, return a Scenario for every
+    combination of start and goal, each repeated repeats times with
+    consecutive seeds counting up from seed.
+    """
+    scenarios = []
+
+    for start in starts:
+        for goal in goals:
+            for _ in range(repeats):
+                scenarios.append(Scenario(start, goal, turns, reward,
+                                          seed + len(scenarios)))
+
+    return scenarios
+
+
+def random_starts(n, environment=None, seed=0):
+    """
+    Return a list of n random start points in the free space of the
+    environment, by default the maze in environment_details.
+    """
+    if environment is None:
+        environment = env.environment
+
+    sampler = percepts.free_space_sampler(environment, environment.x_bounds,
+                                          environment.y_bounds)
+    rng = random.Random(seed)
+
+    return [sampler.sample(rng) for _ in range(n)]
+
+
+def run_scenario(index, scenario, environment=None, exact_heuristic=False):
+    """
+    Run a single scenario without printing anything, and return its
+    EpisodeResult.
+    """
+    rng = random.Random(scenario.seed)
+    start = time.perf_counter()
+
+    episode = simulation.run_episode(scenario.turns, scenario.goal,
+                                     scenario.reward, scenario.start,
+                                     exact_heuristic, environment,
+                                     events.SilentSink(), rng)
+
+    return EpisodeResult(index, scenario, episode.score, episode.turns,
+                         episode.goals_reached, episode.first_goal_turn,
+                         time.perf_counter() - start)
+
+
+def _attach_worker(handle):
+    global _worker_environment
+    _worker_environment = shared_environment.attach(handle)
+
+
+def _run_task(task):
+    index, scenario, exact_heuristic = task
+    return run_scenario(index, scenario, _worker_environment, exact_heuristic)
+
+
+def run_batch(scenarios, workers=None, chunksize=None, environment=None,
+              exact_heuristic=False):
+    """
+    Given a list of Scenarios, run them across a pool of worker processes
+    and yield their EpisodeResults in the order of the scenarios. The
+    environment (by default the maze in environment_details) is compiled
+    once and shared with the workers through shared memory.
+
+    Scenarios are sent to the workers chunksize at a time, by default
+    enough for about four chunks per worker. A result is only yielded once
+    every scenario before it has finished.
+    """
+    scenarios = list(scenarios)
+
+    if environment is None:
+        environment = env.environment
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if chunksize is None:
+        chunksize = max(1, len(scenarios) // (workers * 4))
+
+    tasks = [(i, scenario, exact_heuristic) for i, scenario in enumerate(scenarios)]
+
+    with shared_environment.SharedEnvironment(environment) as shared:
+        with concurrent.futures.ProcessPoolExecutor(
+                workers, initializer=_attach_worker,
+                initargs=(shared.handle,)) as pool:
+            for result in pool.map(_run_task, tasks, chunksize=chunksize):
+                yield result
+
+
+def summarize(results):
+    """
+    Given a list of EpisodeResults, return a dictionary of summary
+    statistics over them.
+    """
+    results = list(results)
+
+    if not results:
+        return {'episodes': 0}
+
+    scores = np.array([r.score for r in results], dtype=np.float64)
+    turns = np.array([r.turns for r in results], dtype=np.float64)
+    goals = np.array([r.goals_reached for r in results], dtype=np.float64)
+    times = np.array([r.wall_time for r in results], dtype=np.float64)
+    first = np.array([r.first_goal_turn for r in results
+                      if r.first_goal_turn is not None], dtype=np.float64)
+
+    return {'episodes': len(results),
+            'success_rate': float((goals > 0).mean()),
+            'score_mean': float(scores.mean()),
+            'score_std': float(scores.std()),
+            'score_min': float(scores.min()),
+            'score_median': float(np.median(scores)),
+            'score_max': float(scores.max()),
+            'turns_mean': float(turns.mean()),
+            'goals_mean': float(goals.mean()),
+            'goals_total': int(goals.sum()),
+            'first_goal_turn_mean': float(first.mean()) if len(first) else None,
+            'wall_time_total': float(times.sum()),
+            'wall_time_mean': float(times.mean())}
+
+
+def _point(text):
+    x, y = ast.literal_eval(text)
+    return geom.Point(x, y)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog='python -m learningagent.batch',
+        description='Run many agent simulations in parallel.')
+    parser.add_argument('scenario_file', nargs='?',
+                        help='JSON lines file of scenarios; if not given, '
+                             'a grid of random starts is generated')
+    parser.add_argument('--starts', type=int, default=16,
+                        help='number of random start points for the grid')
+    parser.add_argument('--goal', type=_point, action='append',
+                        help='goal point for the grid, e.g. "(34, 22)"; '
+                             'may be repeated')
+    parser.add_argument('--turns', type=int, default=250)
+    parser.add_argument('--reward', type=int, default=1000)
+    parser.add_argument('--repeats', type=int, default=1,
+                        help='runs of each start and goal, with different seeds')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunksize', type=int, default=None)
+    parser.add_argument('--exact-heuristic', action='store_true')
+    args = parser.parse_args()
+
+    if args.scenario_file:
+        with open(args.scenario_file) as f:
+            scenarios = read_scenarios(f)
+    else:
+        scenarios = scenario_grid(random_starts(args.starts, seed=args.seed),
+                                  args.goal or [geom.Point(34, 22)],
+                                  args.turns, args.reward, args.repeats,
+                                  args.seed)
+
+    print('index\tstart\tgoal\tscore\tturns\tgoals\tfirst_goal_turn\tseconds')
+
+    results = []
+    for result in run_batch(scenarios, args.workers, args.chunksize,
+                            exact_heuristic=args.exact_heuristic):
+        results.append(result)
+        print('{}\t{}\t{}\t{:.2f}\t{}\t{}\t{}\t{:.3f}'.format(
+            result.index, result.scenario.start, result.scenario.goal,
+            result.score, result.turns, result.goals_reached,
+            result.first_goal_turn, result.wall_time))
+        sys.stdout.flush()
+
+    print()
+    for name, value in summarize(results).items():
+        print('{}: {}'.format(name, value))
@@ -0,0 +1,74 @@
+# Module to benchmark how long the package takes to start up, for short
+# jobs where importing the package is a large part of the running time.
+
+import os
+import subprocess
+import sys
+import time
+
+# Modules which must import without pulling in matplotlib
+CORE_MODULES = ['learningagent.geometry_helpers',
+                'learningagent.agent_percepts',
+                'learningagent.agent',
+                'learningagent.simulation']
+
+# Run in a fresh interpreter: time the import, then report which of the
+# heavy optional modules it loaded along the way.
+_IMPORT_SCRIPT = '''
+import sys, time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+print(' '.join(m for m in ['matplotlib', 'pylab'] if m in sys.modules))
+'''
+
+
+def cold_start(module):
+    """
+    Given the name of a module, import it in a new Python process and
+    return a tuple of (seconds for the whole process, seconds for the
+    import alone, list of heavy modules it loaded).
+    """
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [package_root] + [p for p in [env.get('PYTHONPATH')] if p])
+
+    start = time.perf_counter()
+    output = subprocess.check_output(
+        [sys.executable, '-c', _IMPORT_SCRIPT.format(module=module)],
+        env=env, universal_newlines=True)
+    total = time.perf_counter() - start
+
+    lines = output.splitlines()
+    loaded = lines[1].split() if len(lines) > 1 else []
+
+    return total, float(lines[0]), loaded
+
+
+def startup_times(modules, repeat=5):
+    """
+    Given a list of module names, return a list of (module, total seconds,
+    import seconds, heavy modules loaded) tuples, keeping the fastest of
+    repeat cold starts for each module.
+    """
+    results = []
+
+    for module in modules:
+        runs = [cold_start(module) for _ in range(repeat)]
+        total = min(run[0] for run in runs)
+        imported = min(run[1] for run in runs)
+        results.append((module, total, imported, runs[0][2]))
+
+    return results
+
+
+if __name__ == "__main__":
+    modules = sys.argv[1:] or CORE_MODULES + ['learningagent.plot']
+
+    print('{:<32} {:>10} {:>10}  {}'.format('module', 'process', 'import',
+                                             'heavy modules loaded'))
+
+    for module, total, imported, loaded in startup_times(modules):
+        print('{:<32} {:>9.1f}ms {:>9.1f}ms  {}'.format(
+            module, total * 1000, imported * 1000, ', '.join(loaded) or '-'))
@@ -0,0 +1,188 @@
+# Module for the maze an agent moves through, packed into arrays once so
+# that everything precomputed from it can be cached by its contents.
+
+import collections
+import hashlib
+import math
+
+import numpy as np
+
+from learningagent import geometry_helpers as geom
+
+# Most lists of obstacles environment_of remembers the Environment for. The
+# least recently used is forgotten when another list is added.
+max_list_environments = 64
+
+
+class Environment():
+    """
+    Immutable maze: a list of obstacles and the farthest legal x and y
+    coordinates. The obstacles' vertices and edges are packed into
+    contiguous arrays, with obstacle i owning rows offsets[i] to
+    offsets[i + 1] of both.
+
+    Bounds which aren't given default to the farthest obstacle vertex,
+    rounded up to a whole number.
+
+    An Environment can be used wherever a list of obstacles is expected.
+    Its key is a hash of the obstacle geometry, so two environments built
+    from equal obstacles share everything cached for them.
+    """
+
+    def __init__(self, obstacles, x_bounds=None, y_bounds=None):
+        obstacles = tuple(obstacles)
+        offsets = np.cumsum([0] + [len(o.lines) for o in obstacles], dtype=np.intp)
+        vertices = geom.pack_vertices(obstacles)
+        edges = geom.pack_edges(obstacles)
+        bounds = geom.pack_bounds(obstacles)
+
+        if x_bounds is None:
+            x_bounds = _farthest(vertices[:, 0])
+        if y_bounds is None:
+            y_bounds = _farthest(vertices[:, 1])
+
+        digest = hashlib.sha1()
+        for array in [offsets, vertices, edges]:
+            digest.update(array.tobytes())
+
+        self._freeze(obstacles, x_bounds, y_bounds, offsets, vertices, edges,
+                     bounds, digest.hexdigest())
+
+
+    @classmethod
+    def from_arrays(cls, obstacles, x_bounds, y_bounds, offsets, vertices,
+                    edges, bounds, key):
+        """
+        Return an Environment using already packed arrays and key, e.g.
+        ones attached from shared memory, without copying or rehashing
+        them. The arrays must match the obstacles.
+        """
+        environment = cls.__new__(cls)
+        environment._freeze(tuple(obstacles), x_bounds, y_bounds, offsets,
+                            vertices, edges, bounds, key)
+
+        return environment
+
+
+    def _freeze(self, obstacles, x_bounds, y_bounds, offsets, vertices, edges,
+                bounds, key):
+        for array in [offsets, vertices, edges, bounds]:
+            array.flags.writeable = False
+
+        attributes = {'obstacles': obstacles, 'x_bounds': x_bounds,
+                      'y_bounds': y_bounds, 'offsets': offsets,
+                      'vertices': vertices, 'edges': edges, 'bounds': bounds,
+                      'key': key}
+
+        for name, value in attributes.items():
+            object.__setattr__(self, name, value)
+
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Environment is immutable')
+
+
+    def __delattr__(self, name):
+        raise AttributeError('Environment is immutable')
+
+
+    def __repr__(self):
+        return 'Environment({} obstacles, bounds ({}, {}), key {})'.format(
+            len(self.obstacles), self.x_bounds, self.y_bounds, self.key[:12])
+
+
+    def __eq__(self, other):
+        if not isinstance(other, Environment):
+            return NotImplemented
+
+        return (self.key == other.key and self.x_bounds == other.x_bounds
+                and self.y_bounds == other.y_bounds)
+
+
+    def __hash__(self):
+        return hash((self.key, self.x_bounds, self.y_bounds))
+
+
+    def __len__(self):
+        return len(self.obstacles)
+
+
+    def __iter__(self):
+        return iter(self.obstacles)
+
+
+    def __getitem__(self, i):
+        return self.obstacles[i]
+
+
+    @property
+    def visible_obstacles(self):
+        """
+        The obstacles as a list.
+        """
+        return list(self.obstacles)
+
+
+    def obstacle_vertices(self, i):
+        """
+        Return the (n, 2) array of the vertices of obstacle i.
+        """
+        return self.vertices[self.offsets[i]:self.offsets[i + 1]]
+
+
+    def obstacle_edges(self, i):
+        """
+        Return the (n, 4) array of the edges of obstacle i.
+        """
+        return self.edges[self.offsets[i]:self.offsets[i + 1]]
+
+
+def _farthest(coordinates):
+    """
+    Given an array of coordinates, return the largest rounded up to a
+    whole number, or 0 if there are none.
+    """
+    if len(coordinates) == 0:
+        return 0
+
+    return int(math.ceil(coordinates.max()))
+
+
+# Environments for plain lists of obstacles, keyed by the ids of the
+# obstacles, least recently used first. The lists are kept so their ids
+# can't be reused while their entry is.
+_environments = collections.OrderedDict()
+
+
+def environment_of(obstacles):
+    """
+    Given an Environment or a list of obstacles, return the Environment
+    for it. Environments for lists are built once per list of obstacles,
+    with their bounds taken from the obstacles.
+    """
+    if isinstance(obstacles, Environment):
+        return obstacles
+
+    key = tuple(id(obstacle) for obstacle in obstacles)
+    entry = _environments.get(key)
+
+    if entry is None:
+        entry = (list(obstacles), Environment(obstacles))
+        _environments[key] = entry
+
+        while len(_environments) > max_list_environments:
+            _environments.popitem(last=False)
+    else:
+        _environments.move_to_end(key)
+
+    return entry[1]
+
+
+def forget(environment):
+    """
+    Given an Environment, forget every list of obstacles environment_of
+    has matched to an Environment with the same key.
+    """
+    for key, entry in list(_environments.items()):
+        if entry[1].key == environment.key:
+            del _environments[key]
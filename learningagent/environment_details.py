@@ -1,4 +1,5 @@
 from learningagent.geometry_helpers import Point, Obstacle
+from learningagent.environment import Environment
 
 # Farthest legal x and y coordinates, respectively
 x_bounds = 40
@@ -49,3 +50,6 @@ quadrilateral = Obstacle([[Point(32, 23), Point(35, 21)],
 
 visible_obstacles = [rectangle1, pentagon, triangle1, trapezoid,
              triangle2, rectangle2, hexagon, quadrilateral]
+
+# The maze as a whole, for passing around and keying caches
+environment = Environment(visible_obstacles, x_bounds, y_bounds)
@@ -0,0 +1,295 @@
+# Module for the events a simulation reports as it runs, and the sinks
+# which record them: as text, into a NumPy record array or binary file, as
+# JSON lines, or not at all.
+
+import json
+import sys
+
+import numpy as np
+
+# Kinds of event, stored in the 'kind' field of event records
+STARTED = 0
+OBSERVED = 1
+ATTEMPTED = 2
+MOVED = 3
+REACHED_GOAL = 4
+FAILED = 5
+
+EVENT_NAMES = ['started', 'observed', 'attempted', 'moved', 'reached_goal',
+               'failed']
+
+# One event: the agent's true position, its believed position or intended
+# move, the target of its move (or the goal, for STARTED) and its score.
+# Fields an event doesn't have are NaN.
+EVENT_DTYPE = np.dtype([('kind', np.uint8), ('turn', np.int32),
+                        ('x', np.float64), ('y', np.float64),
+                        ('belief_x', np.float64), ('belief_y', np.float64),
+                        ('target_x', np.float64), ('target_y', np.float64),
+                        ('score', np.float64)])
+
+
+class EventSink():
+    """
+    Receives the events of a simulation. This base class ignores them all,
+    so subclasses only need to override the events they record.
+    """
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+    def started(self, location, goal):
+        """
+        The agent starts at location, heading for goal.
+        """
+
+
+    def observed(self, belief, location):
+        """
+        At the start of a turn, the agent believes it's at belief and is
+        actually at location.
+        """
+
+
+    def attempted(self, intended, target):
+        """
+        The agent tries to move to intended, which from where it actually
+        is means moving to target.
+        """
+
+
+    def moved(self, location, score):
+        """
+        The agent finished its turn at location, with the given score.
+        """
+
+
+    def reached_goal(self, location, score):
+        """
+        The agent reached the goal, scoring score, and was reset to location.
+        """
+
+
+    def failed(self, location):
+        """
+        The agent ran out of turns without reaching the goal, at location.
+        """
+
+
+    def close(self):
+        """
+        Write out anything still buffered.
+        """
+
+
+class SilentSink(EventSink):
+    """
+    Event sink which does nothing, for runs where only the result matters.
+    """
+
+
+class TextSink(EventSink):
+    """
+    Event sink which writes the simulation's traditional text log to f,
+    by default whatever sys.stdout is when each event happens.
+    """
+
+    def __init__(self, f=None):
+        self.f = f
+
+
+    def _write(self, text):
+        (self.f or sys.stdout).write(text)
+
+
+    def started(self, location, goal):
+        self._write('Agent starting at point {}\nAgent goal: {}\n'.format(
+            location, goal))
+
+
+    def observed(self, belief, location):
+        self._write('Agent currently believes it is at point {}\n'
+                    'Agent is actually at point {}\n'.format(belief, location))
+
+
+    def attempted(self, intended, target):
+        self._write('Agent believes it is attempting to reach point {}\n'
+                    'Agent actually attempting to reach point {}\n'.format(
+                        intended, target))
+
+
+    def moved(self, location, score):
+        self._write('Agent now at point {}\nAgent score: {}\n'.format(
+            location, score))
+
+
+    def reached_goal(self, location, score):
+        self._write('Resetting agent to point {}\nAgent score: {}\n'.format(
+            location, score))
+
+
+    def failed(self, location):
+        self._write('Agent failed to find goal in alloted turns.\n'
+                    'Final agent location: {}\n'.format(location))
+
+
+def _xy(p):
+    if p is None:
+        return np.nan, np.nan
+
+    return p.x, p.y
+
+
+class RecordSink(EventSink):
+    """
+    Event sink which stores events in a preallocated EVENT_DTYPE record
+    array of capacity events. Without a file the array doubles in size
+    when it fills up, and self.events holds every event. With a binary
+    file f, each full array is written to f in one block instead, and
+    read_records reads them back.
+    """
+
+    def __init__(self, capacity=4096, f=None):
+        self.buffer = np.empty(capacity, dtype=EVENT_DTYPE)
+        self.count = 0
+        self.turn = 0
+        self.f = f
+
+
+    @property
+    def events(self):
+        """
+        The events recorded and not yet written to the file.
+        """
+        return self.buffer[:self.count]
+
+
+    def _record(self, kind, location=None, belief=None, target=None,
+                score=np.nan):
+        if self.count == len(self.buffer):
+            if self.f is not None:
+                self.flush()
+            else:
+                self.buffer = np.resize(self.buffer, 2 * len(self.buffer))
+
+        x, y = _xy(location)
+        belief_x, belief_y = _xy(belief)
+        target_x, target_y = _xy(target)
+        self.buffer[self.count] = (kind, self.turn, x, y, belief_x, belief_y,
+                                   target_x, target_y, score)
+        self.count += 1
+
+
+    def started(self, location, goal):
+        self._record(STARTED, location, target=goal)
+
+
+    def observed(self, belief, location):
+        self._record(OBSERVED, location, belief)
+
+
+    def attempted(self, intended, target):
+        self._record(ATTEMPTED, belief=intended, target=target)
+
+
+    def moved(self, location, score):
+        self._record(MOVED, location, score=score)
+        self.turn += 1
+
+
+    def reached_goal(self, location, score):
+        self._record(REACHED_GOAL, location, score=score)
+
+
+    def failed(self, location):
+        self._record(FAILED, location)
+
+
+    def flush(self):
+        """
+        Write the recorded events to the file, if there is one.
+        """
+        if self.f is not None and self.count:
+            self.f.write(self.events.tobytes())
+            self.count = 0
+
+
+    def close(self):
+        self.flush()
+
+
+def read_records(f):
+    """
+    Given a binary file written by a RecordSink, return its events as an
+    EVENT_DTYPE record array.
+    """
+    return np.frombuffer(f.read(), dtype=EVENT_DTYPE)
+
+
+class JSONLSink(EventSink):
+    """
+    Event sink which writes each event to the text file f as a line of
+    JSON, in blocks of block_size events.
+    """
+
+    def __init__(self, f, block_size=1024):
+        self.f = f
+        self.block_size = block_size
+        self.lines = []
+        self.turn = 0
+
+
+    def _record(self, kind, **fields):
+        event = {'event': EVENT_NAMES[kind], 'turn': self.turn}
+
+        for name, value in fields.items():
+            if value is not None and hasattr(value, 'x'):
+                value = [value.x, value.y]
+            event[name] = value
+
+        self.lines.append(json.dumps(event))
+
+        if len(self.lines) >= self.block_size:
+            self.flush()
+
+
+    def started(self, location, goal):
+        self._record(STARTED, location=location, goal=goal)
+
+
+    def observed(self, belief, location):
+        self._record(OBSERVED, belief=belief, location=location)
+
+
+    def attempted(self, intended, target):
+        self._record(ATTEMPTED, intended=intended, target=target)
+
+
+    def moved(self, location, score):
+        self._record(MOVED, location=location, score=score)
+        self.turn += 1
+
+
+    def reached_goal(self, location, score):
+        self._record(REACHED_GOAL, location=location, score=score)
+
+
+    def failed(self, location):
+        self._record(FAILED, location=location)
+
+
+    def flush(self):
+        """
+        Write the buffered events to the file.
+        """
+        if self.lines:
+            self.f.write('\n'.join(self.lines) + '\n')
+            self.lines = []
+
+
+    def close(self):
+        self.flush()
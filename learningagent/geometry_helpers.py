@@ -1,20 +1,102 @@
 import math
-from matplotlib import path
+
+import numpy as np
+
 
 class Point():
+    """
+    Immutable 2D point. The hash is computed once, since points are used
+    heavily as dictionary keys.
+    """
+    __slots__ = ('x', 'y', '_hash')
 
     def __init__(self, x, y):
-        self.x = x
-        self.y = y
+        object.__setattr__(self, 'x', x)
+        object.__setattr__(self, 'y', y)
+        object.__setattr__(self, '_hash', hash((x, y)))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Point is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('Point is immutable')
+
+    def __reduce__(self):
+        return (Point, (self.x, self.y))
 
     def __repr__(self):
         return '({}, {})'.format(self.x, self.y)
 
     def __eq__(self, other):
-        return (self.x, self.y) == (other.x, other.y)
+        try:
+            return self.x == other.x and self.y == other.y
+        except AttributeError:
+            return NotImplemented
 
     def __hash__(self):
-        return hash((self.x, self.y))
+        return self._hash
+
+
+class PointArray():
+    """
+    Struct-of-arrays container for many points, backed by contiguous
+    x and y float64 arrays. Iterating or indexing yields Points.
+    """
+    __slots__ = ('x', 'y')
+
+    def __init__(self, x, y):
+        self.x = np.ascontiguousarray(x, dtype=np.float64).reshape(-1)
+        self.y = np.ascontiguousarray(y, dtype=np.float64).reshape(-1)
+
+        if self.x.shape != self.y.shape:
+            raise ValueError('x and y must have the same length')
+
+    @classmethod
+    def from_points(cls, points):
+        """
+        Given an iterable of Points, return a PointArray holding them.
+        """
+        points = list(points)
+        return cls([p.x for p in points], [p.y for p in points])
+
+    @classmethod
+    def from_array(cls, array):
+        """
+        Given an (N, 2) array of coordinates, return a PointArray.
+        """
+        array = np.asarray(array, dtype=np.float64).reshape(-1, 2)
+        return cls(array[:, 0], array[:, 1])
+
+    def to_array(self):
+        """
+        Return the points as an (N, 2) float64 array.
+        """
+        return np.column_stack((self.x, self.y))
+
+    def __len__(self):
+        return len(self.x)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return Point(float(self.x[index]), float(self.y[index]))
+
+        return PointArray(self.x[index], self.y[index])
+
+    def __iter__(self):
+        for x, y in zip(self.x.tolist(), self.y.tolist()):
+            yield Point(x, y)
+
+    def __eq__(self, other):
+        if not isinstance(other, PointArray):
+            return NotImplemented
+
+        return (np.array_equal(self.x, other.x)
+                and np.array_equal(self.y, other.y))
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'PointArray({})'.format(list(self))
 
 
 class Obstacle():
@@ -24,11 +106,55 @@ class Obstacle():
         # of each tuple is the unique point
         self.lines = lines
 
+        xs = [line[0].x for line in lines]
+        ys = [line[0].y for line in lines]
+        # (min_x, min_y, max_x, max_y) of the obstacle's vertices
+        self.bounds = (min(xs), min(ys), max(xs), max(ys)) if lines else None
+        self.vertex_array = np.array(list(zip(xs, ys)),
+                                     dtype=np.float64).reshape(-1, 2)
+
+        self.vertices = frozenset(line[0] for line in lines)
+        # Edges as unordered pairs of endpoints
+        self.edges = frozenset(frozenset(line) for line in lines)
+
 
     def __repr__(self):
         return '{}'.format(self.lines)
 
 
+def pack_edges(obstacles):
+    """
+    Given a list of obstacles, return their edges packed into an (E, 4)
+    float64 array, where each row is (x1, y1, x2, y2).
+    """
+    edges = [(line[0].x, line[0].y, line[1].x, line[1].y)
+             for obstacle in obstacles for line in obstacle.lines]
+
+    return np.array(edges, dtype=np.float64).reshape(-1, 4)
+
+
+def pack_vertices(obstacles):
+    """
+    Given a list of obstacles, return their vertices packed into a (V, 2)
+    float64 array, in the same order as the obstacles and their lines.
+    """
+    vertices = [(line[0].x, line[0].y)
+                for obstacle in obstacles for line in obstacle.lines]
+
+    return np.array(vertices, dtype=np.float64).reshape(-1, 2)
+
+
+def pack_bounds(obstacles):
+    """
+    Given a list of obstacles, return their bounds packed into an (N, 4)
+    float64 array, where each row is (min_x, min_y, max_x, max_y) and
+    obstacles without any lines have a row of NaN.
+    """
+    bounds = [obstacle.bounds or (np.nan,) * 4 for obstacle in obstacles]
+
+    return np.array(bounds, dtype=np.float64).reshape(-1, 4)
+
+
 def distance(p1, p2):
     """
     Given two points, return the distance between them.
@@ -38,24 +164,17 @@ def distance(p1, p2):
 
 def point_inside_own_obstacle(p, O):
     """
-    Given a point and an obstacle, determine if p is a vertex of O.
+    Given a point p and an obstacle O, determine if p is a vertex of O.
     """
-    return p in [v[0] for v in O.lines]
+    return p in O.vertices
 
 
 def line_is_valid_for_own_obstacle(p, r, O):
     """
     Given a line pr and its member obstacle O, determine if line pr
-    crosses through O.
+    is one of O's edges, rather than crossing through O.
     """
-    line_in_obstacle = False
-
-    for line in O.lines:
-        if (sorted([p, r], key=lambda p: p.x + p.y)
-            == sorted(line, key=lambda p: p.x + p.y)):
-            line_in_obstacle = True
-
-    return line_in_obstacle
+    return frozenset((p, r)) in O.edges
 
 
 def point_in_any_obstacle(p, obstacles):
@@ -64,19 +183,103 @@ def point_in_any_obstacle(p, obstacles):
     is inside any obstacles.
     """
     for obstacle in obstacles:
-        unique_points = [(line[0].x, line[0].y) for line in obstacle.lines]
-        matplot_obstacle = path.Path(unique_points)
-        if matplot_obstacle.contains_point((p.x, p.y)):
+        if obstacle.bounds is None:
+            continue
+
+        min_x, min_y, max_x, max_y = obstacle.bounds
+
+        if (min_x <= p.x <= max_x and min_y <= p.y <= max_y
+            and point_in_obstacle(p, obstacle)):
             return True
 
     return False
 
 
+def point_in_obstacle(p, O):
+    """
+    Given a point p and an obstacle O, determine if p is inside O.
+
+    Uses even-odd ray casting with the crossing rule from matplotlib's
+    Path.contains_point, so points on the boundary are classified the same
+    way as they were when obstacles were matplotlib paths.
+    """
+    inside = False
+    x0, y0 = O.lines[-1][0].x, O.lines[-1][0].y
+    yflag0 = y0 >= p.y
+
+    for line in O.lines:
+        x1, y1 = line[0].x, line[0].y
+        yflag1 = y1 >= p.y
+
+        if (yflag0 != yflag1 and
+            (((y1 - p.y) * (x0 - x1)) >= ((x1 - p.x) * (y0 - y1))) == yflag1):
+            inside = not inside
+
+        x0, y0, yflag0 = x1, y1, yflag1
+
+    return inside
+
+
+def points_in_obstacles(points, obstacles, chunk_size=4096):
+    """
+    Given an (N, 2) array, PointArray or list of points and a list of
+    obstacles, return a boolean array of length N which is True where the
+    point is inside any obstacle.
+
+    Uses even-odd ray casting on every edge at once, with the same
+    crossing rule as point_in_obstacle, so points on an obstacle's
+    boundary are classified the same as point_in_any_obstacle.
+    """
+    if isinstance(points, PointArray):
+        points = points.to_array()
+    elif not isinstance(points, np.ndarray):
+        points = [(p.x, p.y) for p in points]
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+
+    obstacles = [obstacle for obstacle in obstacles if obstacle.lines]
+    inside = np.zeros(len(points), dtype=bool)
+
+    if not obstacles or len(points) == 0:
+        return inside
+
+    # Each edge runs from the previous vertex of its obstacle to the next
+    current = np.concatenate([o.vertex_array for o in obstacles])
+    previous = np.concatenate([np.roll(o.vertex_array, 1, axis=0) for o in obstacles])
+    offsets = np.cumsum([0] + [len(o.vertex_array) for o in obstacles[:-1]])
+
+    x0, y0 = previous[:, 0], previous[:, 1]
+    x1, y1 = current[:, 0], current[:, 1]
+
+    for start in range(0, len(points), chunk_size):
+        tx = points[start:start + chunk_size, 0, None]
+        ty = points[start:start + chunk_size, 1, None]
+
+        yflag0 = y0 >= ty
+        yflag1 = y1 >= ty
+        crossings = ((yflag0 != yflag1) &
+                     ((((y1 - ty) * (x0 - x1)) >= ((x1 - tx) * (y0 - y1))) == yflag1))
+
+        # A point is inside an obstacle if it crosses an odd number of its edges
+        counts = np.add.reduceat(crossings, offsets, axis=1)
+        inside[start:start + chunk_size] = (counts % 2 == 1).any(axis=1)
+
+    return inside
+
+
 def obstacle_inside_area(p, r, O):
     """
     Given an obstacle O, determine whether O lies
     inside the rectangle surrounding line segment pr
     """
+    if O.bounds is None:
+        return False
+
+    min_x, min_y, max_x, max_y = O.bounds
+
+    if (max_x < min(p.x, r.x) or min_x > max(p.x, r.x) or
+        max_y < min(p.y, r.y) or min_y > max(p.y, r.y)):
+        return False
+
     for vertex in [v[0] for v in O.lines]:
         if inside_area(p, vertex, r):
             return True
@@ -203,3 +406,87 @@ def do_intersect(p1, q1, p2, q2):
     # Doesn't fall into any of the above cases
     else:
         return False
+
+
+def orientations(px, py, qx, qy, rx, ry):
+    """
+    Vectorised orientation of the ordered triplets (p, q, r), for arrays of
+    coordinates that broadcast together. Returns the sign of the same value
+    orientation computes: 0 for colinear, 1 for clockwise and
+    -1 for counterclockwise.
+    """
+    return np.sign(((qy - py) * (rx - qx)) - ((qx - px) * (ry - qy)))
+
+
+def on_segments(px, py, rx, ry, qx, qy, epsilon):
+    """
+    Vectorised inside_area and on_segment: determine if each point q lies
+    on the corresponding line segment pr.
+    """
+    inside = ((qx <= np.maximum(px, rx)) & (qx >= np.minimum(px, rx)) &
+              (qy <= np.maximum(py, ry)) & (qy >= np.minimum(py, ry)))
+
+    crossproduct = (qy - py) * (rx - px) - (qx - px) * (ry - py)
+    dotproduct = (qx - px) * (rx - px) + (qy - py) * (ry - py)
+    squaredlengthba = (rx - px) * (rx - px) + (ry - py) * (ry - py)
+
+    return (inside & (np.abs(crossproduct) <= epsilon)
+            & (dotproduct >= 0) & (dotproduct <= squaredlengthba))
+
+
+def segments_intersect(p1x, p1y, q1x, q1y, p2x, p2y, q2x, q2y, epsilon=0.01):
+    """
+    Vectorised do_intersect: determine if line segments p1q1 and p2q2
+    intersect, for arrays of coordinates that broadcast together.
+    """
+    # Find the four orientations needed
+    o1 = orientations(p1x, p1y, q1x, q1y, p2x, p2y)
+    o2 = orientations(p1x, p1y, q1x, q1y, q2x, q2y)
+    o3 = orientations(p2x, p2y, q2x, q2y, p1x, p1y)
+    o4 = orientations(p2x, p2y, q2x, q2y, q1x, q1y)
+
+    # General case
+    intersect = (o1 != o2) & (o3 != o4)
+
+    # Special cases, where one segment ends on the other
+    for o, px, py, rx, ry, qx, qy in [(o1, p1x, p1y, q1x, q1y, p2x, p2y),
+                                      (o2, p1x, p1y, q1x, q1y, q2x, q2y),
+                                      (o3, p2x, p2y, q2x, q2y, p1x, p1y),
+                                      (o4, p2x, p2y, q2x, q2y, q1x, q1y)]:
+        colinear = o == 0
+        if colinear.any():
+            intersect |= colinear & on_segments(px, py, rx, ry, qx, qy, epsilon)
+
+    return intersect
+
+
+def segment_blocked(p, r, edges):
+    """
+    Given a line segment pr and an (E, 4) array of packed edges, determine
+    if any edge which doesn't touch p or r intersects pr. This is
+    obstacle_blocks_line applied to every edge at once.
+    """
+    px, py, rx, ry = float(p.x), float(p.y), float(r.x), float(r.y)
+    ax, ay, bx, by = edges.T
+
+    # Cheap first pass: only edges which cross the line through p and r,
+    # or have an endpoint on it, can possibly intersect pr.
+    o1 = orientations(px, py, rx, ry, ax, ay)
+    o2 = orientations(px, py, rx, ry, bx, by)
+    candidates = np.flatnonzero((o1 != o2) | (o1 == 0))
+
+    if candidates.size == 0:
+        return False
+
+    ax, ay, bx, by = edges[candidates].T
+
+    touching = (((ax == px) & (ay == py)) | ((bx == px) & (by == py)) |
+                ((ax == rx) & (ay == ry)) | ((bx == rx) & (by == ry)))
+    candidates = ~touching
+
+    if not candidates.any():
+        return False
+
+    ax, ay, bx, by = ax[candidates], ay[candidates], bx[candidates], by[candidates]
+
+    return bool(segments_intersect(px, py, rx, ry, ax, ay, bx, by).any())
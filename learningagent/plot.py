@@ -1,161 +1,276 @@
-import numpy as np
-
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-import matplotlib.animation as animation
-from matplotlib.patches import Polygon, YAArrow, Circle
-from matplotlib.text import Text
-
-import pylab
+# Module to render a video of an agent's movements, either from a
+# simulation log or live from the events of a simulation.
 
 import ast
+import os
+import subprocess
 import sys
 
+import numpy as np
+
+from learningagent import geometry_helpers as geom
 from learningagent import environment_details
+from learningagent import events
 
-def update_plot(p1, p2, arrow, txt, ax, fig, reset_points, line):
-    """
-    Given a line with an agent's move and the current plot, update
-    the plot based on the agent's move.
-    """
-    l = line.strip()
+# matplotlib is imported inside the functions which draw, so importing this
+# module (or the rest of the package) doesn't pay for loading it.
 
-    if 'Agent score' in l:
-        txt.remove()
-        txt = plt.text(2, 33, 'Agent Score: {0:.2f}'.format(float(l.split()[2])),
-                       fontsize=8)
-        reset_points = True
-    else:
-        p = ast.literal_eval(l[l.find('('):])
-
-        if 'actually at point' in l:
-            p1 = Circle(p, radius=0.2, facecolor='yellow')
-            ax.add_patch(p1)
-        elif 'actually attempting to reach point' in l:
-            p2 = Circle(p, radius=0.2, facecolor='green')
-            ax.add_patch(p2)
-        elif 'now at point' in l:
-            arrow = YAArrow(fig, p2.center, p1.center, width=0.1,
-                            headwidth=0.5, facecolor='red')
-            ax.add_patch(arrow)
-        elif 'Resetting agent to point' in l:
-            p2 = Circle(p, radius=1, facecolor='green')
-            ax.add_patch(p2)
-
-            arrow = YAArrow(fig, p2.center, p1.center, width=0.25,
-                            headwidth=1, facecolor='red')
-            ax.add_patch(arrow)
-
-    return p1, p2, arrow, txt, ax, fig, reset_points
-
-
-def process_remaining_lines(p1, p2, arrow, txt, ax, fig, im, f):
+# The first line of each pair of log lines written by events.TextSink, and
+# the event the pair describes.
+_EVENT_LINES = [('Agent starting at point', 'started'),
+                ('Agent currently believes it is at point', 'observed'),
+                ('Agent believes it is attempting to reach point', 'attempted'),
+                ('Agent now at point', 'moved'),
+                ('Resetting agent to point', 'reached_goal'),
+                ('Agent failed to find goal in alloted turns.', 'failed')]
+
+
+def _log_value(line):
     """
-    Given a record of agent movements, update the plot based on the
-    contents of the record.
+    Given a line of a simulation log, return the point or number at the
+    end of it.
     """
-    reset_points = False
+    if 'point ' in line:
+        text = line[line.rfind('point ') + len('point '):]
+    else:
+        text = line[line.rfind(': ') + 2:]
+
+    value = ast.literal_eval(text)
 
-    for line in f:
-        # Convert image from fig into a numpy array
-        fig.canvas.draw()
-        data = np.fromstring(fig.canvas.tostring_rgb(), dtype=np.uint8, sep='')
-        data = data.reshape(fig.canvas.get_width_height()[::-1] + (3,))
+    if isinstance(value, tuple):
+        return geom.Point(*value)
 
-        yield data
+    return value
 
-        if reset_points:
-            p1.remove()
-            p2.remove()
-            arrow.remove()
-            reset_points = False
 
-        p1, p2, arrow, txt, ax, fig, reset_points = update_plot(
-            p1, p2, arrow, txt, ax, fig, reset_points, line)
+def replay_log(f, sink):
+    """
+    Given an open simulation log, as written by events.TextSink, report
+    the events in it to the EventSink sink.
+    """
+    lines = (line.strip() for line in f)
+    lines = (line for line in lines if line)
 
+    for line in lines:
+        for prefix, name in _EVENT_LINES:
+            if line.startswith(prefix):
+                values = [] if name == 'failed' else [_log_value(line)]
+                values.append(_log_value(next(lines)))
+                getattr(sink, name)(*values)
+                break
 
-def generate_frames(p1, p2, arrow, txt, ax, fig, f):
+
+class FFmpegWriter():
     """
-    Record each frame of agent movement and compile the results into a video.
+    Pipes raw RGBA frames of width x height pixels into an ffmpeg process,
+    which encodes them into the video file at path.
     """
-    # Initialize plot with start and goal points
-    l = f.readline().strip()
-    starting_point = ast.literal_eval(l[l.find('('):])
-    l = f.readline().strip()
-    goal_point = ast.literal_eval(l[l.find('('):])
-
-    ax.add_patch(Circle(goal_point, radius=0.2, facecolor='orange'))
-
-    # Draw initial state of the maze
-    fig.canvas.draw()
-    data = np.fromstring(fig.canvas.tostring_rgb(), dtype=np.uint8, sep='')
-    data = data.reshape(fig.canvas.get_width_height()[::-1] + (3,))
-    im = ax.imshow(data)
-
-    def animate(data, im):
-        im.set_data(data)
-
-    # Generator for the rest of the agent's movements, which
-    # gets passed as the data parameter for each call to animate.
-    remaining_lines = process_remaining_lines(p1, p2, arrow, txt, ax, fig, im, f)
-    # the first two lines are about environment setup, rather than agent movement
-    agent_turns = line_count - 2
-
-    ani = animation.FuncAnimation(
-        fig=fig,
-        func=animate,
-        frames=remaining_lines,
-        interval=10,
-        fargs=(im, ),
-        repeat=False,
-        save_count=agent_turns)
-    writer = animation.writers['ffmpeg'](fps=15, codec='libx264', bitrate=-1)
-
-    ani.save('{}.mp4'.format(video_name), writer=writer, dpi=100)
-
-
-def create_video(input_file, line_count, video_name, visible_obstacles):
+
+    def __init__(self, path, width, height, fps=15, codec='libx264'):
+        self.process = subprocess.Popen(
+            ['ffmpeg', '-y', '-loglevel', 'error',
+             '-f', 'rawvideo', '-pix_fmt', 'rgba',
+             '-s', '{}x{}'.format(width, height), '-r', str(fps), '-i', '-',
+             '-an', '-vcodec', codec, '-pix_fmt', 'yuv420p', path],
+            stdin=subprocess.PIPE)
+
+
+    def write(self, frame):
+        self.process.stdin.write(frame)
+
+
+    def close(self):
+        self.process.stdin.close()
+
+        if self.process.wait() != 0:
+            raise RuntimeError('ffmpeg exited with code {}'.format(
+                self.process.returncode))
+
+
+class FrameRenderer(events.EventSink):
     """
-    Given an input file which logs an agent's movements,
-    create a video file which records the sequence of movements.
+    Event sink which renders a frame of the maze for every event and
+    writes it to output, anything with a write method taking the frame's
+    bytes (such as an FFmpegWriter) and optionally a close method.
+
+    The obstacles and goal are drawn once into a cached background. Each
+    frame restores the background, draws only the agent's markers, the
+    arrow for its move and its score on top, and hands over the canvas's
+    RGBA buffer without copying it.
     """
-    obstacle_plots = []
 
-    # convert obstacles into lists of tuples so matplotlib can
-    # understand them.
-    for obstacle in visible_obstacles:
-        obstacle_plots.append([ast.literal_eval(repr(line[0]))
-                               for line in obstacle.lines])
+    def __init__(self, visible_obstacles, output, xlim=(0, 42), ylim=(0, 35),
+                 size=(8.4, 7), dpi=100):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+        from matplotlib.patches import Circle, Polygon
+
+        self.output = output
+        self.figure = Figure(figsize=size, dpi=dpi, frameon=False)
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.axes = self.figure.add_axes([0, 0, 1, 1], xlim=xlim, ylim=ylim)
+        self.axes.set_axis_off()
+
+        for obstacle in visible_obstacles:
+            self.axes.add_patch(Polygon(obstacle.vertex_array))
+
+        self.position = Circle((0, 0), radius=0.2, facecolor='yellow',
+                               visible=False, animated=True)
+        self.target = Circle((0, 0), radius=0.2, facecolor='green',
+                             visible=False, animated=True)
+        self.axes.add_patch(self.position)
+        self.axes.add_patch(self.target)
+
+        self.arrow = None
+        self.score = self.axes.text(2, 33, 'Agent Score: {0:.2f}'.format(0),
+                                    fontsize=8, animated=True)
+
+        self._cache_background()
+
+
+    @property
+    def width_height(self):
+        """
+        The (width, height) of each frame in pixels.
+        """
+        width, height = self.canvas.get_width_height()
+        return int(width), int(height)
+
+
+    def _cache_background(self):
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+
 
-    # initialize plot and obstacles for the maze
-    fig = plt.figure(frameon=False)
-    txt = plt.text(2, 33, 'agent score: {}'.format(0), fontsize=8)
-    ax = fig.add_subplot(111, aspect='equal', ylim=[0.0, 35], xlim=[0.0, 42])
+    def frame(self):
+        """
+        Return the last frame rendered as a (height, width, 4) RGBA array.
+        It shares memory with the canvas, so it changes with the next frame.
+        """
+        return np.asarray(self.canvas.buffer_rgba())
 
-    for ob in obstacle_plots:
-        ax.add_patch(Polygon(ob))
 
-    arrow = None
-    p1 = None
-    p2 = None
+    def render(self):
+        """
+        Draw the agent over the background and write the frame to output.
+        """
+        self.canvas.restore_region(self.background)
+
+        for artist in [self.position, self.target, self.arrow, self.score]:
+            if artist is not None and artist.get_visible():
+                self.axes.draw_artist(artist)
+
+        self.output.write(self.canvas.buffer_rgba())
+
+
+    def _set_arrow(self, start=None, end=None, width=0.1, head_width=0.5):
+        from matplotlib.patches import FancyArrow
+
+        if self.arrow is not None:
+            self.arrow.remove()
+            self.arrow = None
+
+        if start is None or start == end:
+            return
+
+        self.arrow = FancyArrow(start.x, start.y, end.x - start.x,
+                                end.y - start.y, width=width,
+                                head_width=head_width,
+                                length_includes_head=True, facecolor='red',
+                                edgecolor='red', animated=True)
+        self.axes.add_patch(self.arrow)
+
+
+    def _set_target(self, p, radius):
+        self.target.set_center((p.x, p.y))
+        self.target.set_radius(radius)
+        self.target.set_visible(True)
+
+
+    def _clear_move(self):
+        self.target.set_visible(False)
+        self._set_arrow()
+
+
+    def started(self, location, goal):
+        from matplotlib.patches import Circle
+
+        # The goal never moves, so it belongs in the background
+        self.axes.add_patch(Circle((goal.x, goal.y), radius=0.2,
+                                   facecolor='orange'))
+        self._cache_background()
+
+        self.position.set_center((location.x, location.y))
+        self.position.set_visible(True)
+        self.render()
+
+
+    def observed(self, belief, location):
+        self.position.set_center((location.x, location.y))
+        self.position.set_visible(True)
+        self.render()
+
+
+    def attempted(self, intended, target):
+        self._set_target(target, 0.2)
+        self.render()
+
+
+    def moved(self, location, score):
+        start = geom.Point(*self.position.center)
+        self._set_arrow(start, location)
+        self.score.set_text('Agent Score: {0:.2f}'.format(score))
+        self.render()
+
+        self.position.set_center((location.x, location.y))
+        self._clear_move()
+
+
+    def reached_goal(self, location, score):
+        start = geom.Point(*self.position.center)
+        self._set_target(location, 1)
+        self._set_arrow(start, location, width=0.25, head_width=1)
+        self.score.set_text('Agent Score: {0:.2f}'.format(score))
+        self.render()
+
+        self.position.set_center((location.x, location.y))
+        self._clear_move()
+
+
+    def failed(self, location):
+        self.position.set_center((location.x, location.y))
+        self.render()
+
+
+    def close(self):
+        if hasattr(self.output, 'close'):
+            self.output.close()
+
+
+def create_video(input_file, video_name, visible_obstacles, fps=15):
+    """
+    Given an input file which logs an agent's movements,
+    create a video file which records the sequence of movements.
+    """
+    if not os.path.splitext(video_name)[1]:
+        video_name += '.mp4'
 
-    # remove extra border around subplot
-    frame = plt.gca()
-    frame.axes.get_xaxis().set_visible(False)
-    frame.axes.get_yaxis().set_visible(False)
-    frame.set_frame_on(False)
+    renderer = FrameRenderer(visible_obstacles, None)
+    width, height = renderer.width_height
+    renderer.output = FFmpegWriter(video_name, width, height, fps)
 
-    with open(input_file) as f:
-        generate_frames(p1, p2, arrow, txt, ax, fig, f)
+    with open(input_file) as f, renderer:
+        replay_log(f, renderer)
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 4:
-        print('usage: python plot.py agent_log_file file_line_count video_name')
+    if len(sys.argv) < 3:
+        print('usage: python -m learningagent.plot agent_log_file video_name')
     else:
+        # Logs used to be passed with their line count before the video
+        # name, which is still accepted and ignored.
         agent_movements = sys.argv[1]
-        line_count = int(sys.argv[2])
-        video_name = sys.argv[3]
+        video_name = sys.argv[-1]
         visible_obstacles = environment_details.visible_obstacles
 
-        create_video(agent_movements, line_count, video_name, visible_obstacles)
+        create_video(agent_movements, video_name, visible_obstacles)
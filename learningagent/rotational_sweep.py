@@ -0,0 +1,355 @@
+# Module implementing a rotational sweep (Lee's algorithm) for finding the
+# vertices visible from a point in O(n log n).
+#
+# A ray from the query point p is swept once around p. The obstacle edges it
+# crosses are kept in a balanced tree ordered by their distance from p along
+# the ray, so each vertex only needs to be tested against the nearest edges
+# in front of it, instead of against every edge in the environment.
+
+import math
+import random
+
+from learningagent import geometry_helpers as geom
+
+# Relative tolerance used when comparing distances along the sweep ray
+TOLERANCE = 1e-9
+
+
+class SweepEdge():
+    """
+    An obstacle edge as seen from the sweep origin p. The edge is crossed by
+    every ray from p with an angle in [start, end].
+    """
+    __slots__ = ('line', 'first', 'last', 'start', 'end', 'index')
+
+    def __init__(self, line, first, last, start, end, index):
+        self.line = line
+        # Endpoints of the edge, in the order the sweep reaches them
+        self.first = first
+        self.last = last
+        self.start = start
+        self.end = end
+        self.index = index
+
+    def __repr__(self):
+        return '{}'.format(self.line)
+
+    def distance(self, p, angle):
+        """
+        Given the sweep origin p and the angle of the sweep ray, return
+        the distance from p to where the ray crosses this edge.
+        """
+        dx = math.cos(angle)
+        dy = math.sin(angle)
+        ex = self.last.x - self.first.x
+        ey = self.last.y - self.first.y
+        denominator = dx * ey - dy * ex
+
+        if denominator == 0:
+            return math.inf
+
+        return ((self.first.x - p.x) * ey - (self.first.y - p.y) * ex) / denominator
+
+
+class _Node():
+    __slots__ = ('edge', 'priority', 'left', 'right')
+
+    def __init__(self, edge, priority):
+        self.edge = edge
+        self.priority = priority
+        self.left = None
+        self.right = None
+
+
+class EdgeStatus():
+    """
+    Treap of the edges crossed by the sweep ray. Edges are ordered by the
+    comparison function less(e1, e2), which must be consistent with the
+    order of the edges along the current sweep ray.
+    """
+
+    def __init__(self, seed=0):
+        self.root = None
+        self._random = random.Random(seed)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        """
+        Yield the edges in order, nearest edge first.
+        """
+        stack = []
+        node = self.root
+
+        while stack or node is not None:
+            if node is not None:
+                stack.append(node)
+                node = node.left
+            else:
+                node = stack.pop()
+                yield node.edge
+                node = node.right
+
+    def insert(self, edge, less):
+        self.root = _insert(self.root, _Node(edge, self._random.random()), less)
+        self._size += 1
+
+    def remove(self, edge, less):
+        self.root = _remove(self.root, edge, less)
+        self._size -= 1
+
+
+def _rotate_right(node):
+    left = node.left
+    node.left = left.right
+    left.right = node
+    return left
+
+
+def _rotate_left(node):
+    right = node.right
+    node.right = right.left
+    right.left = node
+    return right
+
+
+def _insert(node, new, less):
+    if node is None:
+        return new
+
+    if less(new.edge, node.edge):
+        node.left = _insert(node.left, new, less)
+        if node.left.priority > node.priority:
+            node = _rotate_right(node)
+    else:
+        node.right = _insert(node.right, new, less)
+        if node.right.priority > node.priority:
+            node = _rotate_left(node)
+
+    return node
+
+
+def _merge(left, right):
+    if left is None:
+        return right
+    if right is None:
+        return left
+
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        return left
+    else:
+        right.left = _merge(left, right.left)
+        return right
+
+
+def _remove(node, edge, less):
+    if node is None:
+        raise KeyError(edge)
+
+    if node.edge is edge:
+        return _merge(node.left, node.right)
+
+    if less(edge, node.edge):
+        node.left = _remove(node.left, edge, less)
+    else:
+        node.right = _remove(node.right, edge, less)
+
+    return node
+
+
+def _angle(p, q):
+    """
+    Return the angle of point q around p, in the range [0, 2 * pi).
+    """
+    angle = math.atan2(q.y - p.y, q.x - p.x)
+
+    if angle < 0:
+        angle += 2 * math.pi
+
+    return angle
+
+
+def _cross(p, q, r):
+    return (q.x - p.x) * (r.y - p.y) - (q.y - p.y) * (r.x - p.x)
+
+
+def _dot(p, q, r):
+    return (q.x - p.x) * (r.x - p.x) + (q.y - p.y) * (r.y - p.y)
+
+
+def _group_by_angle(p, vertices):
+    """
+    Given the sweep origin p and a list of (index, vertex) pairs, return
+    a list of (angle, [(index, vertex), ...]) groups of the vertices lying
+    on the same ray from p, sorted by angle and then by distance.
+    """
+    ordered = sorted(vertices, key=lambda v: (_angle(p, v[1]),
+                                              geom.distance(p, v[1])))
+    groups = []
+
+    for i, vertex in ordered:
+        if (groups
+            and _cross(p, groups[-1][1][0][1], vertex) == 0
+            and _dot(p, groups[-1][1][0][1], vertex) > 0):
+            groups[-1][1].append((i, vertex))
+        else:
+            groups.append((_angle(p, vertex), [(i, vertex)]))
+
+    return groups
+
+
+def _blocks(p, r, line):
+    """
+    Given a line pr and an obstacle edge, determine if the edge blocks pr,
+    using the same rules as geometry_helpers.obstacle_blocks_line.
+    """
+    return (p not in line and r not in line
+            and geom.do_intersect(p, r, line[0], line[1]))
+
+
+def visible_vertices(p, visible_obstacles):
+    """
+    Given a point p and a set of obstacles S, return a list of vertices
+    visible from p, using a rotational sweep around p.
+
+    Returns the same vertices, in the same order, as testing every vertex
+    with agent_percepts.line_is_unblocked.
+    """
+    vertices = [line[0] for obstacle in visible_obstacles
+                for line in obstacle.lines]
+
+    # Obstacles p is a vertex of. Vertices of these obstacles are only
+    # visible from p along the obstacle's own edges.
+    own_obstacles = [obstacle for obstacle in visible_obstacles
+                     if geom.point_inside_own_obstacle(p, obstacle)]
+
+    candidates = [(i, vertex) for i, vertex in enumerate(vertices)
+                  if vertex != p]
+    groups = _group_by_angle(p, candidates)
+
+    # Every vertex on the same ray from p shares that ray's angle
+    angles = {}
+    for angle, group in groups:
+        for i, vertex in group:
+            angles[vertex] = angle
+
+    starting = {}
+    ending = {}
+    collinear = {}
+    through = []
+    status = EdgeStatus()
+    initial = []
+    edge_count = 0
+
+    for obstacle in visible_obstacles:
+        for line in obstacle.lines:
+            a, b = line[0], line[1]
+
+            if p in line:
+                # Edges touching p never block a line from p
+                continue
+
+            cross = _cross(p, a, b)
+
+            if cross == 0:
+                if _dot(p, a, b) > 0:
+                    # Edge lies along a ray from p
+                    collinear.setdefault(angles[a], []).append(line)
+                else:
+                    # p lies on the edge itself
+                    through.append(line)
+                continue
+
+            first, last = (a, b) if cross > 0 else (b, a)
+            edge = SweepEdge(line, first, last, angles[first], angles[last],
+                             edge_count)
+            edge_count += 1
+
+            if edge.start > edge.end:
+                # Edge crosses the starting ray of the sweep
+                edge.start -= 2 * math.pi
+                initial.append(edge)
+                ending.setdefault(edge.end, []).append(edge)
+                starting.setdefault(angles[first], []).append(edge)
+            else:
+                starting.setdefault(edge.start, []).append(edge)
+                ending.setdefault(edge.end, []).append(edge)
+
+    def ordering(angle, step):
+        def less(e1, e2):
+            t1 = e1.distance(p, angle)
+            t2 = e2.distance(p, angle)
+
+            if abs(t1 - t2) > TOLERANCE * max(1, abs(t1), abs(t2)):
+                return t1 < t2
+
+            # The edges meet on the sweep ray, so compare them a little
+            # further along in the direction of the sweep step.
+            if step > 0:
+                span = min(e1.end, e2.end) - angle
+            else:
+                span = angle - max(e1.start, e2.start)
+
+            nearby = angle + step * span / 2
+            t1 = e1.distance(p, nearby)
+            t2 = e2.distance(p, nearby)
+
+            if t1 != t2:
+                return t1 < t2
+
+            return e1.index < e2.index
+
+        return less
+
+    less = ordering(0, -1)
+    for edge in initial:
+        status.insert(edge, less)
+
+    visible = [False] * len(vertices)
+
+    for angle, group in groups:
+        group_lines = [edge.line for edge in starting.get(angle, [])]
+        group_lines.extend(collinear.get(angle, []))
+        group_lines.extend(through)
+
+        for i, vertex in group:
+            if any(geom.point_inside_own_obstacle(vertex, obstacle)
+                   and not geom.line_is_valid_for_own_obstacle(p, vertex, obstacle)
+                   for obstacle in own_obstacles):
+                continue
+
+            if any(_blocks(p, vertex, line) for line in group_lines):
+                continue
+
+            limit = geom.distance(p, vertex)
+            limit += TOLERANCE * max(1, limit)
+            blocked = False
+
+            # The status is ordered by distance, so only the edges in front
+            # of the vertex need to be tested.
+            for edge in status:
+                if edge.distance(p, angle) > limit:
+                    break
+                if _blocks(p, vertex, edge.line):
+                    blocked = True
+                    break
+
+            visible[i] = not blocked
+
+        less = ordering(angle, -1)
+        for edge in ending.get(angle, []):
+            status.remove(edge, less)
+
+        less = ordering(angle, 1)
+        for edge in starting.get(angle, []):
+            if edge.start < 0:
+                # Edge was in the initial status, so it now runs from its
+                # first vertex round to the end of the sweep.
+                edge.start = angle
+                edge.end += 2 * math.pi
+            status.insert(edge, less)
+
+    return [vertex for i, vertex in enumerate(vertices) if visible[i]]
@@ -0,0 +1,197 @@
+# Module for sharing a compiled environment between processes. The packed
+# obstacle arrays, the visibility graph and the distance matrix are
+# published once into shared memory (or a file), and worker processes attach
+# to them without rebuilding or copying them.
+
+import os
+
+import numpy as np
+
+from learningagent import geometry_helpers as geom
+from learningagent import agent_percepts as percepts
+from learningagent.environment import Environment, environment_of
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python < 3.8, only file-backed publishing is available
+    shared_memory = None
+
+# Arrays are placed at multiples of this many bytes into the shared block
+ALIGNMENT = 64
+
+# Environments attached in this process, by segment name or file path,
+# along with the shared memory keeping their arrays alive.
+_attached = {}
+
+
+class SharedEnvironmentHandle():
+    """
+    Picklable description of a published environment: where its arrays
+    live, and the (offset, dtype, shape) of each of them. Send it to
+    worker processes and pass it to attach().
+    """
+
+    def __init__(self, name, path, layout, obstacles, x_bounds, y_bounds, key):
+        self.name = name
+        self.path = path
+        self.layout = layout
+        self.obstacles = obstacles
+        self.x_bounds = x_bounds
+        self.y_bounds = y_bounds
+        self.key = key
+
+
+    def __repr__(self):
+        return 'SharedEnvironmentHandle({}, key {})'.format(
+            self.name or self.path, self.key[:12])
+
+
+class SharedEnvironment():
+    """
+    An environment published for other processes. Given an Environment or
+    list of obstacles, builds its visibility graph and distance matrix (or
+    takes them from the cache) and copies them into a new shared memory
+    segment, or into the file at path if one is given.
+
+    The publishing process owns the segment, and should unlink() it (or
+    use the SharedEnvironment as a context manager) once the workers are
+    done with it.
+    """
+
+    def __init__(self, environment, path=None):
+        environment = environment_of(environment)
+        graph = percepts.visibility_graph(environment)
+        columns = [j for visible in graph.adjacency for j in visible]
+
+        arrays = {'offsets': environment.offsets,
+                  'vertices': environment.vertices,
+                  'edges': environment.edges,
+                  'bounds': environment.bounds,
+                  'graph_x': graph.points.x,
+                  'graph_y': graph.points.y,
+                  'graph_offsets': graph.offsets,
+                  'graph_columns': np.array(columns, dtype=np.intp),
+                  'graph_targets': graph.targets}
+
+        if percepts.distance_matrix_dtype is not None:
+            arrays['distances'] = percepts.distance_matrix(environment).matrix
+
+        layout = {}
+        size = 0
+
+        for name, array in arrays.items():
+            offset = -(-size // ALIGNMENT) * ALIGNMENT
+            layout[name] = (offset, array.dtype.str, array.shape)
+            size = offset + array.nbytes
+
+        size = max(size, 1)
+
+        if path is None:
+            if shared_memory is None:
+                raise RuntimeError('Shared memory needs Python 3.8 or later, '
+                                   'publish to a file instead')
+
+            self.segment = shared_memory.SharedMemory(create=True, size=size)
+            name = self.segment.name
+            buffer = self.segment.buf
+        else:
+            self.segment = None
+            name = None
+            buffer = np.memmap(path, dtype=np.uint8, mode='w+', shape=(size,))
+
+        for key, array in arrays.items():
+            _view(buffer, layout[key])[...] = array
+
+        if path is not None:
+            buffer.flush()
+            del buffer
+
+        self.path = path
+        self.handle = SharedEnvironmentHandle(
+            name, path, layout, list(environment.obstacles),
+            environment.x_bounds, environment.y_bounds, environment.key)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.unlink()
+
+
+    def unlink(self):
+        """
+        Remove the published arrays. Processes which have already attached
+        keep their mapping until they exit.
+        """
+        if self.segment is not None:
+            self.segment.close()
+            self.segment.unlink()
+            self.segment = None
+        elif self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _view(buffer, entry):
+    """
+    Given a buffer and an (offset, dtype, shape) layout entry, return the
+    array at that position in the buffer, without copying it.
+    """
+    offset, dtype, shape = entry
+
+    return np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+
+
+def attach(handle):
+    """
+    Given a SharedEnvironmentHandle, return the published Environment,
+    backed by the shared arrays. Its visibility graph and distance matrix
+    are added to the agent_percepts caches, so they aren't rebuilt in this
+    process. Attaching to the same handle again returns the same
+    Environment.
+    """
+    source = handle.name or handle.path
+    entry = _attached.get(source)
+
+    if entry is not None:
+        return entry[1]
+
+    if handle.name is not None:
+        segment = shared_memory.SharedMemory(name=handle.name)
+        buffer = segment.buf
+    else:
+        segment = np.memmap(handle.path, dtype=np.uint8, mode='r')
+        buffer = segment
+
+    arrays = {}
+    for name, layout in handle.layout.items():
+        arrays[name] = _view(buffer, layout)
+        arrays[name].flags.writeable = False
+
+    environment = Environment.from_arrays(
+        handle.obstacles, handle.x_bounds, handle.y_bounds, arrays['offsets'],
+        arrays['vertices'], arrays['edges'], arrays['bounds'], handle.key)
+
+    if handle.key not in percepts.visibility_graph.cache:
+        offsets = arrays['graph_offsets']
+        columns = arrays['graph_columns']
+        rows = [columns[offsets[i]:offsets[i + 1]].tolist()
+                for i in range(len(offsets) - 1)]
+
+        graph = percepts.VisibilityGraph(environment, rows)
+        # Swap the graph's arrays for the shared ones, which are equal
+        graph.points = geom.PointArray(arrays['graph_x'], arrays['graph_y'])
+        graph.offsets = offsets
+        graph.targets = arrays['graph_targets']
+        percepts.visibility_graph.cache[handle.key] = graph
+
+    if 'distances' in arrays and handle.key not in percepts.distance_matrix.cache:
+        vertices = [line[0] for obstacle in environment for line in obstacle.lines]
+        percepts.distance_matrix.cache[handle.key] = percepts.DistanceMatrix(
+            vertices, matrix=arrays['distances'])
+
+    _attached[source] = (segment, environment)
+
+    return environment
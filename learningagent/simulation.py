@@ -1,5 +1,7 @@
 # Module to simulate an agent's movements in the environment
 
+import collections
+import random
 import sys
 import ast
 
@@ -7,16 +9,23 @@ from learningagent import geometry_helpers as geom
 from learningagent import environment_details as env
 from learningagent import agent_percepts as percepts
 from learningagent import agent
+from learningagent import events as sim_events
 
 
-def agent_reached_goal(sim_agent, goal_reward):
+def agent_reached_goal(sim_agent, goal_reward, environment=None, events=None,
+                       rng=random):
     """
     Award goal_points to the agent for reaching the goal
-    and reset it to a new starting point.
+    and reset it to a new starting point in the environment, drawn using
+    rng (a random.Random instance, or the random module by default).
     After resetting the agent, return the agent's true current location.
     """
-    sim_agent.belief_state = agent.State(
-        percepts.get_new_position(env.visible_obstacles, env.x_bounds, env.y_bounds), 1)
+    if environment is None:
+        environment = env.environment
+    if events is None:
+        events = sim_events.TextSink()
+
+    sim_agent.belief_state = agent.State(percepts.get_new_position(environment, rng=rng), 1)
     sim_agent.belief_history = []
     sim_agent.prev_state = agent.State(None, 1)
     sim_agent.score += goal_reward
@@ -24,19 +33,18 @@ def agent_reached_goal(sim_agent, goal_reward):
 
     actual_location = sim_agent.belief_state.location
 
-    print('Resetting agent to point {}'.format(sim_agent.belief_state.location))
-    print('Agent score: {}'.format(sim_agent.score))
+    events.reached_goal(sim_agent.belief_state.location, sim_agent.score)
 
     return actual_location
 
 
-def sim_perform_action(sim_agent, actual_location):
+def sim_perform_action(sim_agent, actual_location, events=None):
     """
     Given the agent's true location, let the agent perform its intended
     action and return the true results of the action.
     """
-    print('Agent believes it is attempting to reach point {}'.format(
-        sim_agent.prev_action))
+    if events is None:
+        events = sim_events.TextSink()
 
     relative_move = geom.Point(
         (sim_agent.prev_action.x - sim_agent.belief_state.location.x),
@@ -46,65 +54,147 @@ def sim_perform_action(sim_agent, actual_location):
         (relative_move.x + actual_location.x),
         (relative_move.y + actual_location.y))
 
-    print('Agent actually attempting to reach point {}'.format(actual_target))
+    events.attempted(sim_agent.prev_action, actual_target)
     actual_location = percepts.perform_action(sim_agent.prev_action)
 
     return actual_location
 
 
-def sim_agent_action(sim_agent, actual_location):
+def sim_agent_action(sim_agent, actual_location, environment=None):
     """
     Allow agent to update its location based on the visible vertices
     relative to its current position and update its score accordingly.
     """
+    if environment is None:
+        environment = env.environment
+
     relative_verts = percepts.vertices_relative_to_agent(
-        percepts.visible_vertices(actual_location, env.visible_obstacles),
+        percepts.visible_vertices(actual_location, environment),
         actual_location)
-    initial_locations = percepts.get_locations(relative_verts, env.visible_obstacles)
+    initial_locations = percepts.get_locations(relative_verts, environment)
 
     sim_agent.update_agent_location(initial_locations)
 
     sim_agent.score -= geom.distance(sim_agent.prev_state.location, actual_location)
 
 
-def run_simulation(number_of_turns, goal_point, goal_reward, initial_location):
+# Summary of one run of the simulation: the agent's final score and
+# location, the number of turns taken, how many times the goal was reached
+# and the turn it was first reached on (None if it never was).
+Episode = collections.namedtuple('Episode', ['score', 'turns', 'goals_reached',
+                                             'first_goal_turn', 'final_location'])
+
+# One step of the simulation. turn is the number of turns taken before the
+# step, belief is where the agent thought it was at the start of the step,
+# and location and score are the agent's true location and score after it.
+# action is the point the agent tried to move to, or None if the step was
+# the agent reaching the goal and being reset. agent is the Agent itself,
+# for looking at its tables.
+Step = collections.namedtuple('Step', ['turn', 'belief', 'action', 'location',
+                                       'score', 'reached_goal', 'agent'])
+
+
+def run_simulation(number_of_turns, goal_point, goal_reward, initial_location,
+                   exact_heuristic=False, environment=None, events=None):
     """
     Given the number of turns allowed, run the simulation for the agent
-    navigating a maze of polygons.
+    navigating a maze of polygons, by default the one in
+    environment_details. If exact_heuristic is set, the agent estimates
+    costs from shortest paths around the obstacles.
+
+    What happens is reported to the EventSink events, by default as text
+    on standard output. Returns True if the agent reached the goal.
+    """
+    episode = run_episode(number_of_turns, goal_point, goal_reward,
+                          initial_location, exact_heuristic, environment,
+                          events)
+
+    return episode.goals_reached > 0
+
+
+def run_episode(number_of_turns, goal_point, goal_reward, initial_location,
+                exact_heuristic=False, environment=None, events=None,
+                rng=random):
     """
+    Run the simulation in the same way as run_simulation, and return an
+    Episode summarising it.
+    """
+    if events is None:
+        events = sim_events.TextSink()
+
+    steps = simulate_steps(number_of_turns, goal_point, goal_reward,
+                           initial_location, exact_heuristic, environment,
+                           events, rng)
+
+    while True:
+        try:
+            next(steps)
+        except StopIteration as finished:
+            return finished.value
+
+
+def simulate_steps(number_of_turns, goal_point, goal_reward, initial_location,
+                   exact_heuristic=False, environment=None, events=None,
+                   rng=random):
+    """
+    Generator running the simulation one step at a time, yielding a Step
+    after each turn and each time the agent reaches the goal. Events are
+    also reported to the EventSink events, by default a SilentSink.
+    New starting points after reaching the goal are drawn using rng.
+
+    The simulation only advances when the next step is asked for, so it
+    can be paused between steps or stopped early by closing the generator.
+    When it runs out of turns, the generator returns an Episode.
+    """
+    if environment is None:
+        environment = env.environment
+    if events is None:
+        events = sim_events.SilentSink()
+
     sim_agent = agent.Agent(goal_point, agent.State(initial_location, 1),
-                            env.visible_obstacles)
+                            environment, exact_heuristic)
     actual_location = initial_location
     remaining_turns = number_of_turns
+    goals_reached = 0
+    first_goal_turn = None
 
-    print('Agent starting at point {}'.format(initial_location))
-    print('Agent goal: {}'.format(goal_point))
+    events.started(initial_location, goal_point)
 
     while remaining_turns > 0:
-        print('Agent currently believes it is at point {}'.format(
-            sim_agent.belief_state.location))
-        print('Agent is actually at point {}'.format(actual_location))
+        turn = number_of_turns - remaining_turns
+        belief = sim_agent.belief_state.location
+        events.observed(belief, actual_location)
 
         sim_agent.LRTA_star_agent()
 
         if not sim_agent.prev_action:
-            actual_location = agent_reached_goal(sim_agent, goal_reward)
+            actual_location = agent_reached_goal(sim_agent, goal_reward,
+                                                 environment, events, rng)
+            goals_reached += 1
+            if first_goal_turn is None:
+                first_goal_turn = turn
+
+            yield Step(turn, belief, None, actual_location, sim_agent.score,
+                       True, sim_agent)
             continue
 
-        actual_location = sim_perform_action(sim_agent, actual_location)
+        action = sim_agent.prev_action
+        actual_location = sim_perform_action(sim_agent, actual_location, events)
 
-        sim_agent_action(sim_agent, actual_location)
+        sim_agent_action(sim_agent, actual_location, environment)
 
-        print('Agent now at point {}'.format(actual_location))
-        print('Agent score: {}'.format(sim_agent.score))
+        events.moved(actual_location, sim_agent.score)
 
         remaining_turns -= 1
 
+        yield Step(turn, belief, action, actual_location, sim_agent.score,
+                   False, sim_agent)
+
     if not sim_agent.reached_goal:
-        print('Agent failed to find goal in alloted turns.')
-        print('Final agent location: {}'.format(agent_location))
+        events.failed(actual_location)
 
-    return sim_agent.reached_goal
+    return Episode(sim_agent.score, number_of_turns - remaining_turns,
+                   goals_reached, first_goal_turn, actual_location)
 
 
 if __name__ == "__main__":
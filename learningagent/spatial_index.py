@@ -0,0 +1,273 @@
+# Module for spatial indexes over obstacle geometry, so that line-of-sight
+# queries only look at the edges near the line instead of every edge.
+
+import math
+
+import numpy as np
+
+from learningagent import geometry_helpers as geom
+
+# Padding added around edge bounding boxes, so edges lying on a cell
+# boundary are found from the cells on either side of it.
+EPSILON = 1e-9
+
+
+class EdgeGrid():
+    """
+    Uniform grid over a packed (E, 4) array of edges. Each cell holds the
+    indices of the edges whose bounding box overlaps it, and segments are
+    walked through the grid cell by cell (DDA traversal), so a query only
+    touches the edges in the cells the segment crosses.
+    """
+
+    def __init__(self, edges, cell_size=None):
+        self.edges = edges
+
+        if len(edges) == 0:
+            self.min_x = self.min_y = 0.0
+            self.cell_size = 1.0
+            self.columns = self.rows = 0
+            self.cells = {}
+            return
+
+        xs = np.concatenate([edges[:, 0], edges[:, 2]])
+        ys = np.concatenate([edges[:, 1], edges[:, 3]])
+
+        if cell_size is None:
+            # Cells about as large as an average edge
+            lengths = np.hypot(edges[:, 2] - edges[:, 0], edges[:, 3] - edges[:, 1])
+            cell_size = float(lengths.mean()) or 1.0
+
+        self.cell_size = cell_size
+        self.min_x = float(xs.min())
+        self.min_y = float(ys.min())
+        self.columns = int((xs.max() - self.min_x) // cell_size) + 1
+        self.rows = int((ys.max() - self.min_y) // cell_size) + 1
+
+        cells = {}
+
+        for index, (x1, y1, x2, y2) in enumerate(edges):
+            i0, j0 = self.cell(min(x1, x2) - EPSILON, min(y1, y2) - EPSILON)
+            i1, j1 = self.cell(max(x1, x2) + EPSILON, max(y1, y2) + EPSILON)
+
+            for i in range(max(i0, 0), min(i1, self.columns - 1) + 1):
+                for j in range(max(j0, 0), min(j1, self.rows - 1) + 1):
+                    cells.setdefault((i, j), []).append(index)
+
+        self.cells = {cell: np.array(indices, dtype=np.intp)
+                      for cell, indices in cells.items()}
+
+
+    def __repr__(self):
+        return 'EdgeGrid({} edges, {}x{} cells of size {})'.format(
+            len(self.edges), self.columns, self.rows, self.cell_size)
+
+
+    def cell(self, x, y):
+        """
+        Return the (column, row) of the cell containing point (x, y).
+        """
+        return (int(math.floor((x - self.min_x) / self.cell_size)),
+                int(math.floor((y - self.min_y) / self.cell_size)))
+
+
+    def _clamp(self, i, j):
+        return (min(max(i, 0), self.columns - 1),
+                min(max(j, 0), self.rows - 1))
+
+
+    def _clip(self, x1, y1, x2, y2):
+        """
+        Clip segment (x1, y1)-(x2, y2) to the area covered by the grid,
+        returning the parameter range [t0, t1] along the segment, or None
+        if the segment misses the grid.
+        """
+        t0, t1 = 0.0, 1.0
+        max_x = self.min_x + self.columns * self.cell_size
+        max_y = self.min_y + self.rows * self.cell_size
+
+        for start, delta, low, high in [(x1, x2 - x1, self.min_x, max_x),
+                                        (y1, y2 - y1, self.min_y, max_y)]:
+            low -= EPSILON
+            high += EPSILON
+
+            if delta == 0:
+                if start < low or start > high:
+                    return None
+                continue
+
+            a = (low - start) / delta
+            b = (high - start) / delta
+            t0 = max(t0, min(a, b))
+            t1 = min(t1, max(a, b))
+
+        if t0 > t1:
+            return None
+
+        return t0, t1
+
+
+    def cells_crossed(self, p, r):
+        """
+        Given a line segment pr, return the list of grid cells it passes
+        through, in order from p to r.
+        """
+        if self.columns == 0:
+            return []
+
+        clipped = self._clip(p.x, p.y, r.x, r.y)
+
+        if clipped is None:
+            return []
+
+        dx = r.x - p.x
+        dy = r.y - p.y
+        x = p.x + clipped[0] * dx
+        y = p.y + clipped[0] * dy
+        end_x = p.x + clipped[1] * dx
+        end_y = p.y + clipped[1] * dy
+
+        i, j = self._clamp(*self.cell(x, y))
+        end_i, end_j = self._clamp(*self.cell(end_x, end_y))
+
+        step_i = 1 if dx > 0 else -1
+        step_j = 1 if dy > 0 else -1
+
+        # Parameter along the segment where it next crosses a column
+        # or row boundary, and the parameter between two crossings.
+        if dx != 0:
+            boundary = self.min_x + (i + (step_i > 0)) * self.cell_size
+            t_max_x = (boundary - x) / dx
+            t_delta_x = self.cell_size / abs(dx)
+        else:
+            t_max_x = t_delta_x = math.inf
+
+        if dy != 0:
+            boundary = self.min_y + (j + (step_j > 0)) * self.cell_size
+            t_max_y = (boundary - y) / dy
+            t_delta_y = self.cell_size / abs(dy)
+        else:
+            t_max_y = t_delta_y = math.inf
+
+        cells = [(i, j)]
+        remaining = abs(end_i - i) + abs(end_j - j)
+
+        while remaining > 0:
+            if (dx != 0 and dy != 0 and
+                abs(t_max_x - t_max_y) <= EPSILON * max(t_delta_x, t_delta_y)):
+                # Passing through a corner, cover both neighbouring cells
+                cells.append((i + step_i, j))
+                cells.append((i, j + step_j))
+                i += step_i
+                j += step_j
+                t_max_x += t_delta_x
+                t_max_y += t_delta_y
+                remaining -= 2
+            elif t_max_x < t_max_y:
+                i += step_i
+                t_max_x += t_delta_x
+                remaining -= 1
+            else:
+                j += step_j
+                t_max_y += t_delta_y
+                remaining -= 1
+
+            cells.append((i, j))
+
+        return cells
+
+
+    def candidate_edges(self, p, r):
+        """
+        Given a line segment pr, return a sorted array of the indices of
+        the edges that could intersect it.
+        """
+        found = [self.cells[cell] for cell in self.cells_crossed(p, r)
+                 if cell in self.cells]
+
+        if not found:
+            return np.empty(0, dtype=np.intp)
+
+        return np.unique(np.concatenate(found))
+
+
+class PointHash():
+    """
+    Spatial hash of points into square buckets whose side is the matching
+    tolerance. A lookup probes the bucket of the query point and, if
+    needed, its eight neighbours, so a stored point within tolerance of the
+    query is found even when rounding puts the two in different buckets.
+    """
+
+    def __init__(self, points, tolerance=1e-6):
+        self.points = list(points)
+        self.tolerance = tolerance
+        self.buckets = {}
+
+        for i, p in enumerate(self.points):
+            self.buckets.setdefault(self._bucket(p.x, p.y), []).append(i)
+
+
+    def __len__(self):
+        return len(self.points)
+
+
+    def __contains__(self, p):
+        return self.find(p.x, p.y) is not None
+
+
+    def _bucket(self, x, y):
+        return (int(math.floor(x / self.tolerance)),
+                int(math.floor(y / self.tolerance)))
+
+
+    def find(self, x, y):
+        """
+        Return the index of a stored point within tolerance of (x, y) in
+        both coordinates, or None if there isn't one.
+        """
+        i, j = self._bucket(x, y)
+
+        for cell in [(i, j), (i - 1, j - 1), (i - 1, j), (i - 1, j + 1),
+                     (i, j - 1), (i, j + 1), (i + 1, j - 1), (i + 1, j),
+                     (i + 1, j + 1)]:
+            for k in self.buckets.get(cell, ()):
+                p = self.points[k]
+
+                if (abs(p.x - x) <= self.tolerance
+                    and abs(p.y - y) <= self.tolerance):
+                    return k
+
+        return None
+
+
+class ObstacleIndex():
+    """
+    Spatial index over a set of obstacles: a bounding box per obstacle,
+    and an EdgeGrid over all of their edges.
+    """
+
+    def __init__(self, obstacles, edges, cell_size=None):
+        self.bounds = geom.pack_bounds(obstacles)
+        self.grid = EdgeGrid(edges, cell_size)
+
+
+    def obstacles_containing(self, p, r):
+        """
+        Given two points p and r, return the indices of the obstacles whose
+        bounding box contains both of them.
+        """
+        min_x, min_y, max_x, max_y = self.bounds.T
+        inside = ((min_x <= min(p.x, r.x)) & (max_x >= max(p.x, r.x)) &
+                  (min_y <= min(p.y, r.y)) & (max_y >= max(p.y, r.y)))
+
+        return np.flatnonzero(inside)
+
+
+    def candidate_edges(self, p, r):
+        """
+        Given a line segment pr, return the indices of the edges which
+        could intersect it.
+        """
+        return self.grid.candidate_edges(p, r)
+
@@ -1,5 +1,7 @@
 import unittest
 
+import numpy
+
 from learningagent import geometry_helpers
 from learningagent import environment_details
 from learningagent import agent
@@ -7,6 +9,158 @@ from learningagent import agent_percepts as percepts
 
 class TestAgent(unittest.TestCase):
 
+    def test_state(self):
+        s = agent.State(geometry_helpers.Point(6, 10), 0.375)
+
+        self.assertEqual(agent.State(geometry_helpers.Point(6, 10), 0.375), s)
+        self.assertNotEqual(agent.State(geometry_helpers.Point(6, 10), 1), s)
+        self.assertEqual(1, len(set([s, agent.State(geometry_helpers.Point(6, 10), 0.375)])))
+        self.assertEqual('((6, 10), 0.375)', repr(s))
+
+        with self.assertRaises(AttributeError):
+            s.certainty = 1
+
+
+    def test_cost_table(self):
+        table = agent.CostTable()
+        p = geometry_helpers.Point(6, 10)
+
+        self.assertEqual({}, table)
+        self.assertEqual(0, table.version)
+
+        table[p] = 4
+        self.assertEqual(1, table.version)
+
+        # Storing the same value again isn't a change
+        table[p] = 4
+        table.setdefault(p, 5)
+        table.update({p: 4})
+        self.assertEqual(1, table.version)
+
+        table.update({p: 5})
+        del table[p]
+        self.assertEqual(3, table.version)
+
+        # Agent tables convert plain dicts, and can share a table
+        sim_agent = agent.Agent(None, None, None)
+        self.assertIs(sim_agent.result, sim_agent.prev_result)
+
+        sim_agent.prev_cost_estimates = {p: 2}
+        self.assertIsInstance(sim_agent.prev_cost_estimates, agent.CostTable)
+        self.assertEqual({p: 2}, sim_agent.prev_cost_estimates)
+
+
+    def test_array_backed_tables(self):
+        graph = percepts.visibility_graph(environment_details.visible_obstacles)
+        vertex = geometry_helpers.Point(6, 2)
+        other = geometry_helpers.Point(5, 5)
+
+        cost_estimates = agent.CostEstimates(graph, {other: 3})
+        cost_estimates[vertex] = 50
+
+        self.assertEqual({vertex: 50, other: 3}, cost_estimates)
+        self.assertEqual(50, cost_estimates.values[graph.vertex_id(vertex)])
+        self.assertNotIn(geometry_helpers.Point(6, 10), cost_estimates)
+
+        del cost_estimates[vertex]
+
+        self.assertEqual({other: 3}, cost_estimates)
+        self.assertTrue(numpy.isnan(cost_estimates.values).all())
+
+        # Moves along the visibility graph to a vertex are stored as ids
+        a = geometry_helpers.Point(6, 10)
+        result = agent.ResultTable(graph)
+        result[(vertex, a)] = a
+        slot = graph.edge_slot(graph.vertex_id(vertex), graph.vertex_id(a))
+
+        self.assertEqual(graph.vertex_id(a), result.states[slot])
+        self.assertEqual({(vertex, a): a}, result)
+
+        # Anything else is kept in a dict
+        result[(vertex, a)] = other
+        result[(other, a)] = a
+
+        self.assertEqual(-1, result.states[slot])
+        self.assertEqual(1, result.row_entries[graph.vertex_id(vertex)])
+        self.assertEqual({(vertex, a): other, (other, a): a}, result)
+
+        result[(vertex, a)] = a
+
+        self.assertEqual(0, result.row_entries[graph.vertex_id(vertex)])
+        self.assertEqual(a, result[(vertex, a)])
+        self.assertFalse((None, None) in result)
+
+
+    def test_row_costs(self):
+        goal = geometry_helpers.Point(34, 22)
+        s = geometry_helpers.Point(6, 2)
+        sim_agent = agent.Agent(goal, None, environment_details.visible_obstacles)
+
+        a = geometry_helpers.Point(6, 10)
+        sim_agent.result[(s, a)] = a
+        sim_agent.cost_estimates[a] = 50
+
+        ids, costs = sim_agent.row_costs(s, sim_agent.result,
+                                         sim_agent.cost_estimates)
+        expected = sim_agent.action_costs(s, sim_agent.result,
+                                          sim_agent.cost_estimates)
+
+        self.assertEqual([action for action, cost in expected],
+                         [sim_agent.graph.vertices[i] for i in ids])
+        self.assertEqual([cost for action, cost in expected], list(costs))
+
+        # Points which aren't vertices use action_costs
+        self.assertIsNone(sim_agent.row_costs(geometry_helpers.Point(5, 5),
+                                              sim_agent.result,
+                                              sim_agent.cost_estimates))
+
+        # With the exact heuristic, untried actions are costed from where
+        # they lead
+        exact_agent = agent.Agent(goal, None, environment_details.visible_obstacles,
+                                  exact_heuristic=True)
+        exact_agent.result[(s, a)] = a
+        exact_agent.cost_estimates[a] = 50
+
+        ids, costs = exact_agent.row_costs(s, exact_agent.result,
+                                           exact_agent.cost_estimates)
+        expected = exact_agent.action_costs(s, exact_agent.result,
+                                            exact_agent.cost_estimates)
+
+        self.assertEqual([action for action, cost in expected],
+                         [exact_agent.graph.vertices[i] for i in ids])
+        self.assertEqual([cost for action, cost in expected], list(costs))
+
+
+    def test_action_costs(self):
+        goal = geometry_helpers.Point(34, 22)
+        s = geometry_helpers.Point(6, 2)
+        sim_agent = agent.Agent(goal, None, environment_details.visible_obstacles)
+
+        costs = sim_agent.action_costs(s, sim_agent.result, sim_agent.cost_estimates)
+
+        self.assertEqual(percepts.actions(s), [action for action, cost in costs])
+        self.assertEqual([sim_agent.LRTA_star_cost(s, action, None, {}, goal)
+                          for action in percepts.actions(s)],
+                         [cost for action, cost in costs])
+
+        # Costs are reused until the tables change
+        cache = sim_agent.action_cost_cache.costs
+        sim_agent.best_actions(s, sim_agent.result, sim_agent.cost_estimates)
+        self.assertIs(cache, sim_agent.action_cost_cache.costs)
+
+        a = geometry_helpers.Point(6, 10)
+        sim_agent.result[(s, a)] = a
+        sim_agent.cost_estimates[a] = 50
+
+        costs = dict(sim_agent.action_costs(s, sim_agent.result,
+                                            sim_agent.cost_estimates))
+
+        self.assertIsNot(cache, sim_agent.action_cost_cache.costs)
+        self.assertEqual(58, costs[a])
+        self.assertNotIn(a, sim_agent.best_actions(s, sim_agent.result,
+                                                   sim_agent.cost_estimates))
+
+
     def test_goal_test(self):
         goal_point = geometry_helpers.Point(29, 17)
         sim_agent = agent.Agent(goal_point, None, None)
@@ -310,5 +464,28 @@ class TestAgent(unittest.TestCase):
 
         self.assertEqual(geometry_helpers.Point(6, 2), sim_agent.prev_state.location)
 
+
+    def test_LRTA_star_agent_exact_heuristic(self):
+        visible_obstacles = environment_details.visible_obstacles
+        goal_point = geometry_helpers.Point(34, 22)
+        agent_location = geometry_helpers.Point(4, 5)
+
+        sim_agent = agent.Agent(goal_point, agent.State(agent_location, 1),
+                                visible_obstacles, exact_heuristic=True)
+
+        sim_agent.LRTA_star_agent()
+
+        self.assertEqual(percepts.shortest_path_heuristic(
+                             agent_location, goal_point, visible_obstacles),
+                         sim_agent.cost_estimates[agent_location])
+
+        # Untried actions are costed from where they lead
+        costs = [percepts.actual_cost(agent_location, a, a)
+                 + sim_agent.heuristic(a)
+                 for a in percepts.actions(agent_location)]
+        best = percepts.actions(agent_location)[costs.index(min(costs))]
+
+        self.assertEqual(best, sim_agent.prev_action)
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,8 +1,13 @@
+import random
+import tempfile
 import unittest
 
+import numpy
+
 from learningagent import geometry_helpers
 from learningagent import environment_details
 from learningagent import agent_percepts as percepts
+from learningagent.environment import Environment
 
 class TestAgentPercepts(unittest.TestCase):
 
@@ -40,6 +45,50 @@ class TestAgentPercepts(unittest.TestCase):
         self.assertFalse(percepts.line_is_unblocked(p, r, visible_obstacles))
 
 
+    def test_line_is_unblocked_with_spatial_index(self):
+        visible_obstacles = environment_details.visible_obstacles
+        vertices = [line[0] for obstacle in visible_obstacles
+                    for line in obstacle.lines]
+        points = vertices + [geometry_helpers.Point(x, y) for x in range(0, 41, 5)
+                             for y in range(0, 26, 5)]
+
+        min_edges = percepts.spatial_index_min_edges
+
+        try:
+            percepts.spatial_index_min_edges = None
+            expected = [percepts.line_is_unblocked(p, r, visible_obstacles)
+                        for p in points for r in vertices]
+
+            percepts.spatial_index_min_edges = 0
+            self.assertEqual(expected,
+                             [percepts.line_is_unblocked(p, r, visible_obstacles)
+                              for p in points for r in vertices])
+        finally:
+            percepts.spatial_index_min_edges = min_edges
+
+
+    def test_line_is_unblocked_vectorised(self):
+        visible_obstacles = environment_details.visible_obstacles
+        vertices = [line[0] for obstacle in visible_obstacles
+                    for line in obstacle.lines]
+        points = vertices + [geometry_helpers.Point(x, y) for x in range(0, 41, 5)
+                             for y in range(0, 26, 5)]
+
+        min_edges = percepts.vectorised_min_edges
+
+        try:
+            percepts.vectorised_min_edges = None
+            expected = [percepts.line_is_unblocked(p, r, visible_obstacles)
+                        for p in points for r in vertices]
+
+            percepts.vectorised_min_edges = 0
+            self.assertEqual(expected,
+                             [percepts.line_is_unblocked(p, r, visible_obstacles)
+                              for p in points for r in vertices])
+        finally:
+            percepts.vectorised_min_edges = min_edges
+
+
     def test_visible_vertices(self):
         visible_obstacles = environment_details.visible_obstacles
 
@@ -110,6 +159,152 @@ class TestAgentPercepts(unittest.TestCase):
                          set(percepts.visible_vertices(p, visible_obstacles)))
 
 
+    def test_visibility_graph(self):
+        visible_obstacles = environment_details.visible_obstacles
+        graph = percepts.visibility_graph(visible_obstacles)
+
+        # The graph is only built once for the same set of obstacles
+        self.assertIs(graph, percepts.visibility_graph(list(visible_obstacles)))
+        self.assertIs(graph, percepts.visibility_graph(environment_details.environment))
+        self.assertIsNot(graph, percepts.visibility_graph(visible_obstacles[:-1]))
+
+        # Adjacency matches a brute-force search from every vertex
+        for vertex in graph.vertices:
+            self.assertEqual(percepts._visible_vertices(vertex, visible_obstacles),
+                             graph.neighbours(vertex))
+
+        # Sweeping from every vertex builds the same graph as the batch
+        max_vertices = percepts.batch_max_vertices
+
+        try:
+            percepts.batch_max_vertices = 0
+            swept = percepts.VisibilityGraph(visible_obstacles)
+        finally:
+            percepts.batch_max_vertices = max_vertices
+
+        self.assertEqual(graph.adjacency, swept.adjacency)
+
+        # Non-vertex points aren't part of the graph
+        p = geometry_helpers.Point(34, 22)
+        self.assertEqual(None, graph.vertex_id(p))
+        self.assertEqual(None, graph.neighbours(p))
+
+        # Vertex-to-vertex visibility
+        self.assertTrue(graph.vertex_visible(geometry_helpers.Point(6, 2),
+                                             geometry_helpers.Point(6, 10)))
+        self.assertFalse(graph.vertex_visible(geometry_helpers.Point(6, 2),
+                                              geometry_helpers.Point(18, 10)))
+
+        # Vertices visible from other points are remembered
+        self.assertEqual(percepts._visible_vertices(p, visible_obstacles),
+                         graph.visible_from(p))
+        self.assertIn(p, graph._seen)
+        self.assertEqual(graph.neighbours(geometry_helpers.Point(6, 2)),
+                         graph.visible_from(geometry_helpers.Point(6, 2)))
+
+        # Point to vertex visibility
+        self.assertTrue(graph.vertex_visible(p, geometry_helpers.Point(35, 21)))
+        self.assertFalse(graph.vertex_visible(p, geometry_helpers.Point(6, 2)))
+        self.assertFalse(graph.vertex_visible(geometry_helpers.Point(35, 21), p))
+
+
+    def test_reduced_visibility_graph(self):
+        visible_obstacles = environment_details.visible_obstacles
+        graph = percepts.visibility_graph(visible_obstacles)
+        reduced = percepts.reduced_visibility_graph(visible_obstacles)
+
+        self.assertEqual(graph.vertices, reduced.vertices)
+        self.assertLess(len(reduced.targets), len(graph.targets))
+
+        for v in graph.vertices:
+            self.assertEqual([w for w in graph.neighbours(v) if reduced.tangent(v, w)],
+                             reduced.neighbours(v))
+
+        # Lines along an edge or round a corner are tangent, lines into
+        # the corner of rectangle1 are not
+        corner = geometry_helpers.Point(18, 2)
+
+        self.assertTrue(reduced.tangent(geometry_helpers.Point(6, 2), corner))
+        self.assertTrue(reduced.tangent(geometry_helpers.Point(12, 0), corner))
+        self.assertFalse(reduced.tangent(geometry_helpers.Point(20, 0), corner))
+
+        # Points off the vertices only go to tangent vertices
+        p = geometry_helpers.Point(5, 5)
+
+        self.assertEqual([v for v in percepts.visible_vertices(p, visible_obstacles)
+                          if reduced.tangent(p, v)],
+                         reduced.reduced_actions(p))
+
+        # Shortest paths only use edges of the reduced graph
+        goal = geometry_helpers.Point(34, 22)
+        visibility = percepts.goal_database(visible_obstacles).goal_visibility(goal)
+
+        self.assertTrue(numpy.allclose(
+            percepts.GoalDistances(graph, goal, visibility).distances,
+            percepts.GoalDistances(reduced, goal, visibility).distances))
+
+        # actions() uses the reduced graph in 'reduced' mode
+        try:
+            percepts.action_graph_mode = 'reduced'
+
+            self.assertIs(reduced, percepts.action_graph())
+            self.assertEqual(reduced.reduced_actions(p), percepts.actions(p))
+        finally:
+            percepts.action_graph_mode = 'full'
+
+        self.assertIs(graph, percepts.action_graph())
+
+
+    def test_visibility_engine(self):
+        visible_obstacles = environment_details.visible_obstacles
+        p = geometry_helpers.Point(23, 8)
+
+        self.assertEqual(percepts.visible_vertices(p, visible_obstacles, 'legacy'),
+                         percepts.visible_vertices(p, visible_obstacles, 'sweep'))
+
+        self.assertRaises(ValueError, percepts.visible_vertices,
+                          p, visible_obstacles, 'unknown')
+
+
+    def test_visible_vertices_batch(self):
+        visible_obstacles = environment_details.visible_obstacles
+        vertices = [line[0] for obstacle in visible_obstacles
+                    for line in obstacle.lines]
+
+        points = [geometry_helpers.Point(x, y) for x in range(0, 41, 4)
+                  for y in range(0, 26, 3)] + vertices
+
+        # Use small chunks so the points are split across several passes
+        chunk_elements = percepts.batch_chunk_elements
+        percepts.batch_chunk_elements = 5000
+        try:
+            visible = percepts.visible_vertices_batch(points, visible_obstacles)
+        finally:
+            percepts.batch_chunk_elements = chunk_elements
+
+        self.assertEqual((len(points), len(vertices)), visible.shape)
+
+        for p, row in zip(points, visible):
+            self.assertEqual(percepts.visible_vertices(p, visible_obstacles, 'legacy'),
+                             [v for v, seen in zip(vertices, row) if seen])
+
+        # Points can also be given as an (N, 2) array
+        visible = percepts.visible_vertices_batch(
+            numpy.array([[34, 22], [5, 1]]), visible_obstacles)
+
+        self.assertEqual(set([geometry_helpers.Point(32, 23), geometry_helpers.Point(35, 21)]),
+                         set(v for v, seen in zip(vertices, visible[0]) if seen))
+        self.assertEqual(set([geometry_helpers.Point(5, 20), geometry_helpers.Point(6, 2),
+                              geometry_helpers.Point(6, 10), geometry_helpers.Point(18, 2)]),
+                         set(v for v, seen in zip(vertices, visible[1]) if seen))
+
+        self.assertEqual(visible[:1].tolist(), percepts.visible_vertices_batch(
+            geometry_helpers.PointArray([34], [22]), visible_obstacles).tolist())
+
+        self.assertEqual((0, len(vertices)),
+                         percepts.visible_vertices_batch([], visible_obstacles).shape)
+
+
     def test_vertices_relative_to_agent(self):
         visible_obstacles = environment_details.visible_obstacles
 
@@ -125,6 +320,14 @@ class TestAgentPercepts(unittest.TestCase):
                               geometry_helpers.Point(2, -5)]),
                          set(percepts.vertices_relative_to_agent(vertices, p)))
 
+        # PointArrays are offset in bulk
+        relative = percepts.vertices_relative_to_agent(
+            geometry_helpers.PointArray.from_points(vertices), p)
+
+        self.assertIsInstance(relative, geometry_helpers.PointArray)
+        self.assertEqual(percepts.vertices_relative_to_agent(vertices, p),
+                         list(relative))
+
         # Test open space in maze near top-left corner
         p = geometry_helpers.Point(34, 22)
         vertices = percepts.visible_vertices(p, visible_obstacles)
@@ -196,6 +399,284 @@ class TestAgentPercepts(unittest.TestCase):
 
 
 
+    def test_localization_index(self):
+        visible_obstacles = environment_details.visible_obstacles
+        index = percepts.LocalizationIndex(visible_obstacles, max_signatures=2)
+
+        # Views from every vertex are indexed up front
+        p = geometry_helpers.Point(32, 6)
+        view = percepts.vertices_relative_to_agent(
+            percepts.visible_vertices(p, visible_obstacles), p)
+
+        self.assertIn(index.signature(view), index._vertex_views)
+        self.assertEqual([p], index.locate(view))
+
+        # Signatures tolerate floating point error
+        nudged = [geometry_helpers.Point(v.x + 1e-12, v.y - 1e-12) for v in view]
+
+        self.assertEqual(index.signature(view), index.signature(nudged))
+
+        # Percepts with rounding error still match the map's vertices
+        p = geometry_helpers.Point(12, 21)
+        noisy = [geometry_helpers.Point(v.x + 3e-7, v.y - 3e-7)
+                 for v in percepts.vertices_relative_to_agent(
+                     percepts.visible_vertices(p, visible_obstacles), p)]
+        locations = index.locate(noisy)
+
+        self.assertEqual(1, len(locations))
+        self.assertAlmostEqual(12, locations[0].x, places=5)
+        self.assertAlmostEqual(21, locations[0].y, places=5)
+
+        # Other views are remembered, up to max_signatures of them
+        views = []
+        for p in [geometry_helpers.Point(34, 22), geometry_helpers.Point(12, 21),
+                  geometry_helpers.Point(5, 5)]:
+            views.append(percepts.vertices_relative_to_agent(
+                percepts.visible_vertices(p, visible_obstacles), p))
+
+        self.assertEqual(set([geometry_helpers.Point(34, 22), geometry_helpers.Point(18, 13)]),
+                         set(index.locate(views[0])))
+
+        for view in views:
+            index.locate(view)
+
+        self.assertEqual([index.signature(views[1]), index.signature(views[2])],
+                         list(index._seen))
+
+        # Callers get their own copy of the locations
+        locations = index.locate(views[2])
+        locations.append(None)
+
+        self.assertEqual([geometry_helpers.Point(5, 5)], index.locate(views[2]))
+
+        # The same percepts in another order are found without matching them
+        # against the vertices again
+        shuffled = list(views[2])
+        random.Random(0).shuffle(shuffled)
+        p = geometry_helpers.Point(32, 6)
+        vertex_view = list(reversed(percepts.vertices_relative_to_agent(
+            percepts.visible_vertices(p, visible_obstacles), p)))
+        seen = list(index._seen)
+        index._match = None
+
+        self.assertNotEqual(views[2], shuffled)
+        self.assertEqual([geometry_helpers.Point(5, 5)], index.locate(shuffled))
+        self.assertEqual([p], index.locate(vertex_view))
+        self.assertEqual(seen, list(index._seen))
+
+        # get_locations shares one index per set of obstacles
+        self.assertIs(percepts.localization_index(visible_obstacles),
+                      percepts.localization_index(list(visible_obstacles)))
+
+
+    def test_ambiguity_count(self):
+        visible_obstacles = environment_details.visible_obstacles
+        table = percepts.AmbiguityTable(visible_obstacles, max_points=1)
+
+        def count(p):
+            return len(percepts.get_locations(
+                percepts.visible_vertices(p, visible_obstacles),
+                visible_obstacles))
+
+        # Every vertex is counted up front
+        for obstacle in visible_obstacles:
+            for line in obstacle.lines:
+                self.assertEqual(count(line[0]), table.vertex_counts[line[0]])
+
+        # Other points are counted when asked for, remembering max_points
+        points = [geometry_helpers.Point(5, 5), geometry_helpers.Point(20, 16)]
+
+        for p in points:
+            self.assertEqual(count(p), table[p])
+
+        self.assertEqual([points[1]], list(table._seen))
+
+        self.assertEqual(count(points[0]),
+                         percepts.ambiguity_count(points[0], visible_obstacles))
+        self.assertIs(percepts.ambiguity_table(visible_obstacles),
+                      percepts.ambiguity_table(list(visible_obstacles)))
+
+
+    def test_distance_matrix(self):
+        visible_obstacles = environment_details.visible_obstacles
+        vertices = [line[0] for obstacle in visible_obstacles
+                    for line in obstacle.lines]
+        matrix = percepts.DistanceMatrix(vertices, block_size=7)
+
+        self.assertEqual(len(vertices), len(matrix))
+
+        for p in vertices:
+            for r in vertices:
+                self.assertEqual(geometry_helpers.distance(p, r),
+                                 matrix.distance(p, r))
+
+        self.assertIsNone(matrix.distance(vertices[0], geometry_helpers.Point(5, 5)))
+
+        # Memory-mapped and single precision matrices
+        with tempfile.TemporaryFile() as f:
+            mapped = percepts.DistanceMatrix(vertices, path=f, block_size=5)
+            self.assertTrue(numpy.array_equal(matrix.matrix, mapped.matrix))
+
+        small = percepts.DistanceMatrix(vertices, dtype=numpy.float32)
+        self.assertEqual(numpy.float32, small.matrix.dtype)
+        self.assertTrue(numpy.allclose(matrix.matrix, small.matrix))
+
+        self.assertIs(percepts.distance_matrix(visible_obstacles),
+                      percepts.action_distances())
+
+        # Vertex distances match the ones heuristic computes
+        p = geometry_helpers.Point(6, 2)
+        r = geometry_helpers.Point(35, 21)
+
+        self.assertEqual(percepts.heuristic(p, r), matrix.distance(p, r))
+
+
+    def test_per_obstacle_set(self):
+        obstacles = environment_details.visible_obstacles
+        original = percepts.max_cached_maps
+
+        try:
+            # Only the most recently used maps are kept
+            percepts.max_cached_maps = 2
+            maps = [Environment(obstacles[:n]) for n in range(1, 5)]
+            first = percepts.visibility_graph(maps[0])
+
+            for environment in maps:
+                percepts.visibility_graph(environment)
+
+            self.assertEqual([maps[2].key, maps[3].key],
+                             list(percepts.visibility_graph.cache))
+            self.assertIsNot(first, percepts.visibility_graph(maps[0]))
+
+            # Releasing a map drops everything built for it
+            percepts.distance_matrix(maps[0])
+            percepts.release(maps[0])
+            self.assertNotIn(maps[0].key, percepts.visibility_graph.cache)
+            self.assertNotIn(maps[0].key, percepts.distance_matrix.cache)
+            self.assertIn(maps[3].key, percepts.visibility_graph.cache)
+        finally:
+            percepts.max_cached_maps = original
+
+
+    def test_goal_visibility(self):
+        visible_obstacles = environment_details.visible_obstacles
+        graph = percepts.visibility_graph(visible_obstacles)
+
+        for goal in [geometry_helpers.Point(34, 22), geometry_helpers.Point(6, 2),
+                     geometry_helpers.Point(8.5, 23)]:
+            visibility = percepts.GoalVisibility(graph, goal)
+
+            self.assertIsNotNone(visibility.angles)
+            self.assertEqual([percepts.line_is_unblocked(v, goal, visible_obstacles)
+                              for v in graph.vertices],
+                             list(visibility.sees_goal))
+
+            # Points off the vertices, including ones on edges and on the
+            # rays through vertices
+            for x in range(0, 43):
+                for y in range(0, 36):
+                    for p in [geometry_helpers.Point(x, y),
+                              geometry_helpers.Point(x + 0.5, y + 0.25)]:
+                        self.assertEqual(
+                            percepts.line_is_unblocked(p, goal, visible_obstacles),
+                            visibility.visible(p))
+
+        self.assertIs(percepts.goal_database(visible_obstacles).goal_visibility(goal),
+                      percepts.goal_database(visible_obstacles).goal_visibility(goal))
+
+        # Crossing edges fall back to line_is_unblocked everywhere
+        def square(x, y, size):
+            corners = [geometry_helpers.Point(x, y),
+                       geometry_helpers.Point(x + size, y),
+                       geometry_helpers.Point(x + size, y + size),
+                       geometry_helpers.Point(x, y + size)]
+            return geometry_helpers.Obstacle([[corners[i], corners[(i + 1) % 4]]
+                                              for i in range(4)])
+
+        squares = [square(0, 0, 4), square(2, 2, 4)]
+        goal = geometry_helpers.Point(8, 1)
+        visibility = percepts.GoalVisibility(percepts.visibility_graph(squares), goal)
+
+        self.assertTrue(percepts.edges_cross(squares))
+        self.assertIsNone(visibility.angles)
+        self.assertTrue(visibility.visible(geometry_helpers.Point(5, 0)))
+        self.assertFalse(visibility.visible(geometry_helpers.Point(1, 5)))
+        self.assertEqual(percepts.line_is_unblocked(geometry_helpers.Point(8, 8),
+                                                    goal, squares),
+                         percepts.goal_visible(geometry_helpers.Point(8, 8),
+                                               goal, squares))
+
+
+    def test_edges_cross(self):
+        def square(x, y, size):
+            corners = [geometry_helpers.Point(x, y),
+                       geometry_helpers.Point(x + size, y),
+                       geometry_helpers.Point(x + size, y + size),
+                       geometry_helpers.Point(x, y + size)]
+            return geometry_helpers.Obstacle([[corners[i], corners[(i + 1) % 4]]
+                                              for i in range(4)])
+
+        # Squares in a row, touching only at shared corners, with the
+        # last one crossed by another
+        row = [square(4 * i, 0, 4) for i in range(10)]
+        crossed = row + [square(38, 2, 4)]
+        chunk_elements = percepts.batch_chunk_elements
+
+        try:
+            for elements in [1, 7, chunk_elements]:
+                percepts.batch_chunk_elements = elements
+
+                self.assertFalse(percepts.edges_cross.__wrapped__(
+                    environment_details.visible_obstacles))
+                self.assertFalse(percepts.edges_cross.__wrapped__(row))
+                self.assertTrue(percepts.edges_cross.__wrapped__(crossed))
+        finally:
+            percepts.batch_chunk_elements = chunk_elements
+
+
+    def test_shortest_path_heuristic(self):
+        visible_obstacles = environment_details.visible_obstacles
+        goal = geometry_helpers.Point(34, 22)
+        database = percepts.GoalDatabase(visible_obstacles, max_goals=1)
+        goal_distances = database.goal_distances(goal)
+        graph = goal_distances.graph
+
+        # Distances satisfy the shortest path equations over the graph
+        for i, v in enumerate(graph.vertices):
+            paths = [geometry_helpers.distance(v, w) + goal_distances.distance(w)
+                     for w in graph.neighbours(v)]
+            if percepts.line_is_unblocked(v, goal, visible_obstacles):
+                paths.append(geometry_helpers.distance(v, goal))
+
+            self.assertAlmostEqual(min(paths), goal_distances.distances[i])
+            self.assertGreaterEqual(goal_distances.distances[i],
+                                    percepts.heuristic(v, goal))
+
+        # Points which see the goal are their straight-line distance away
+        p = geometry_helpers.Point(36, 24)
+
+        self.assertEqual(percepts.heuristic(p, goal), goal_distances.distance(p))
+
+        # Other points go round the obstacles
+        p = geometry_helpers.Point(5, 5)
+        expected = min(geometry_helpers.distance(p, v) + goal_distances.distance(v)
+                       for v in percepts.visible_vertices(p, visible_obstacles))
+
+        self.assertEqual(expected, goal_distances.distance(p))
+        self.assertEqual(expected, percepts.shortest_path_heuristic(
+            p, goal, visible_obstacles))
+
+        # and are remembered
+        self.assertEqual([geometry_helpers.Point(36, 24), p],
+                         list(goal_distances._seen))
+
+        # Only the most recent goals are kept
+        self.assertIs(goal_distances, database.goal_distances(goal))
+        database.goal_distances(geometry_helpers.Point(5, 5))
+
+        self.assertEqual([geometry_helpers.Point(5, 5)], list(database._goals))
+
+
     def test_heuristic(self):
         # For now these tests are slightly redundant since heuristic is just
         # a straight line, but since the heuristic could change in the
@@ -315,5 +796,43 @@ class TestAgentPercepts(unittest.TestCase):
             self.assertFalse(geometry_helpers.point_in_any_obstacle(new_position, obstacles))
 
 
+    def test_free_space_sampler(self):
+        obstacles = environment_details.visible_obstacles
+        x_bounds = environment_details.x_bounds
+        y_bounds = environment_details.y_bounds
+
+        sampler = percepts.free_space_sampler(obstacles, x_bounds, y_bounds)
+
+        # Built once per obstacle set and bounds
+        self.assertIs(sampler, percepts.free_space_sampler(obstacles, x_bounds, y_bounds))
+        self.assertIsNot(sampler, percepts.free_space_sampler(obstacles, 10, 10))
+
+        # Every lattice point outside the obstacles can be sampled
+        free = [geometry_helpers.Point(x, y)
+                for x in range(0, x_bounds + 1) for y in range(0, y_bounds + 1)
+                if not geometry_helpers.point_in_any_obstacle(
+                    geometry_helpers.Point(x, y), obstacles)]
+
+        self.assertEqual(set(free),
+                         set(geometry_helpers.Point(x, y) for x, y in sampler.points.tolist()))
+
+        # Seeded samples are repeatable
+        self.assertEqual(sampler.sample(random.Random(3)), sampler.sample(random.Random(3)))
+        self.assertEqual(sampler.sample_many(1000, seed=7), sampler.sample_many(1000, seed=7))
+
+        positions = sampler.sample_many(1000, seed=7)
+
+        self.assertEqual(1000, len(positions))
+        self.assertFalse(geometry_helpers.points_in_obstacles(positions, obstacles).any())
+
+        # A maze with no free space can't be sampled
+        corners = [geometry_helpers.Point(-1, -1), geometry_helpers.Point(5, -1),
+                   geometry_helpers.Point(5, 5), geometry_helpers.Point(-1, 5)]
+        walls = geometry_helpers.Obstacle([[corners[i], corners[(i + 1) % 4]]
+                                           for i in range(4)])
+
+        self.assertRaises(ValueError, percepts.FreeSpaceSampler, [walls], 3, 3)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,81 @@
+import io
+import random
+import unittest
+
+from learningagent import geometry_helpers
+from learningagent import environment_details
+from learningagent import batch
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.goal = geometry_helpers.Point(34, 22)
+        self.starts = [geometry_helpers.Point(5, 5), geometry_helpers.Point(20, 24)]
+
+
+    def test_scenarios(self):
+        scenarios = batch.scenario_grid(self.starts, [self.goal], turns=30,
+                                        repeats=2, seed=10)
+
+        self.assertEqual(4, len(scenarios))
+        self.assertEqual([10, 11, 12, 13], [s.seed for s in scenarios])
+        self.assertEqual(self.starts[1], scenarios[2].start)
+        self.assertEqual(30, scenarios[0].turns)
+
+        f = io.StringIO('{"start": [5, 5], "goal": [34, 22]}\n\n'
+                        '{"start": [1, 2], "goal": [3, 4], "turns": 10, "seed": 7}\n')
+        scenarios = batch.read_scenarios(f)
+
+        self.assertEqual(batch.Scenario(geometry_helpers.Point(5, 5), self.goal,
+                                        250, 1000, 0), scenarios[0])
+        self.assertEqual((10, 7), (scenarios[1].turns, scenarios[1].seed))
+
+        starts = batch.random_starts(20, seed=3)
+
+        self.assertEqual(starts, batch.random_starts(20, seed=3))
+        self.assertFalse(any(geometry_helpers.point_in_any_obstacle(
+            p, environment_details.visible_obstacles) for p in starts))
+
+
+    def test_run_scenario_seed(self):
+        scenario = batch.Scenario(geometry_helpers.Point(5, 5),
+                                  geometry_helpers.Point(9, 3), 40, 1000, 7)
+
+        # The scenario's seed decides the result, and the global random
+        # state is left alone
+        random.seed(1)
+        first = batch.run_scenario(0, scenario)
+        after = random.random()
+
+        random.seed(2)
+        second = batch.run_scenario(0, scenario)
+
+        random.seed(1)
+        self.assertEqual(after, random.random())
+        self.assertGreater(first.goals_reached, 1)
+        self.assertEqual(first[:-1], second[:-1])
+
+
+    def test_run_batch(self):
+        scenarios = batch.scenario_grid(self.starts, [self.goal], turns=40,
+                                        repeats=2)
+
+        expected = [batch.run_scenario(i, scenario)
+                    for i, scenario in enumerate(scenarios)]
+        results = list(batch.run_batch(scenarios, workers=2, chunksize=1))
+
+        # Seeding each scenario makes the results independent of the worker
+        self.assertEqual([r[:-1] for r in expected], [r[:-1] for r in results])
+        self.assertEqual(40, results[0].turns)
+
+        summary = batch.summarize(results)
+
+        self.assertEqual(4, summary['episodes'])
+        self.assertEqual(sum(r.goals_reached for r in results),
+                         summary['goals_total'])
+        self.assertEqual(max(r.score for r in results), summary['score_max'])
+        self.assertEqual({'episodes': 0}, batch.summarize([]))
+
+
+if __name__ == '__main__':
+    unittest.main()
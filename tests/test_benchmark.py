@@ -0,0 +1,26 @@
+import unittest
+
+from learningagent import benchmark
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_cold_start(self):
+        # The core modules start without loading matplotlib
+        for module in benchmark.CORE_MODULES:
+            total, imported, loaded = benchmark.cold_start(module)
+
+            self.assertEqual([], loaded, module)
+            self.assertGreater(total, imported)
+
+
+    def test_startup_times(self):
+        results = benchmark.startup_times(['learningagent.geometry_helpers'],
+                                          repeat=2)
+
+        self.assertEqual(1, len(results))
+        self.assertEqual('learningagent.geometry_helpers', results[0][0])
+        self.assertEqual([], results[0][3])
+
+
+if __name__ == '__main__':
+    unittest.main()
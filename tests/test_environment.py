@@ -0,0 +1,106 @@
+import pickle
+import unittest
+
+import numpy
+
+from learningagent import geometry_helpers
+from learningagent import environment_details
+from learningagent import environment as environment_module
+from learningagent.environment import Environment, environment_of
+
+class TestEnvironment(unittest.TestCase):
+
+    def test_packed_geometry(self):
+        environment = environment_details.environment
+
+        self.assertEqual(8, len(environment))
+        self.assertEqual(list(environment), environment_details.visible_obstacles)
+        self.assertIs(environment_details.hexagon, environment[6])
+        self.assertEqual((40, 25), (environment.x_bounds, environment.y_bounds))
+
+        self.assertEqual((33, 2), environment.vertices.shape)
+        self.assertEqual((33, 4), environment.edges.shape)
+        self.assertEqual([0, 4, 9, 12, 16, 19, 23, 29, 33],
+                         environment.offsets.tolist())
+        self.assertEqual([[7, 15], [10, 14], [12, 19], [8.5, 23], [5, 20]],
+                         environment.obstacle_vertices(1).tolist())
+        self.assertEqual([6, 2, 18, 2], environment.obstacle_edges(0)[0].tolist())
+        self.assertEqual([26, 3, 32, 12], environment.bounds[6].tolist())
+
+
+    def test_immutable(self):
+        environment = environment_details.environment
+
+        with self.assertRaises(AttributeError):
+            environment.x_bounds = 10
+
+        with self.assertRaises(ValueError):
+            environment.vertices[0, 0] = 1
+
+
+    def test_key(self):
+        environment = environment_details.environment
+
+        # Equal obstacles give the same key, whichever objects they are
+        copies = [geometry_helpers.Obstacle([list(line) for line in obstacle.lines])
+                  for obstacle in environment]
+        copy = Environment(copies, 40, 25)
+
+        self.assertEqual(environment.key, copy.key)
+        self.assertEqual(environment, copy)
+        self.assertEqual(hash(environment), hash(copy))
+
+        self.assertNotEqual(environment, Environment(copies, 30, 25))
+        self.assertNotEqual(environment.key, Environment(copies[:-1]).key)
+
+        restored = pickle.loads(pickle.dumps(environment))
+        self.assertEqual(environment, restored)
+        self.assertTrue(numpy.array_equal(environment.edges, restored.edges))
+
+
+    def test_environment_of(self):
+        environment = environment_details.environment
+        obstacles = environment_details.visible_obstacles
+
+        self.assertIs(environment, environment_of(environment))
+        self.assertIs(environment_of(obstacles), environment_of(list(obstacles)))
+        self.assertEqual(environment.key, environment_of(obstacles).key)
+
+        # Bounds not given are the farthest obstacle vertex
+        self.assertEqual((35, 23), (environment_of(obstacles).x_bounds,
+                                    environment_of(obstacles).y_bounds))
+        self.assertEqual((35, 23), (Environment(obstacles).x_bounds,
+                                    Environment(obstacles).y_bounds))
+
+        empty = environment_of([])
+        self.assertEqual((0, 2), empty.vertices.shape)
+        self.assertEqual([0], empty.offsets.tolist())
+        self.assertEqual((0, 0), (empty.x_bounds, empty.y_bounds))
+
+
+    def test_environment_of_bounded(self):
+        obstacles = environment_details.visible_obstacles
+        original = environment_module.max_list_environments
+
+        try:
+            environment_module.max_list_environments = 2
+            lists = [list(obstacles[:n]) for n in range(1, 5)]
+            first = environment_of(lists[0])
+
+            for l in lists:
+                environment_of(l)
+
+            self.assertLessEqual(len(environment_module._environments), 2)
+            self.assertIsNot(first, environment_of(lists[0]))
+            self.assertEqual(first, environment_of(lists[0]))
+
+            # Forgetting an environment drops every list matched to it
+            environment_module.forget(first)
+            self.assertNotIn(first.key, [entry[1].key for entry in
+                                         environment_module._environments.values()])
+        finally:
+            environment_module.max_list_environments = original
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import contextlib
+import io
+import json
+import random
+import unittest
+
+import numpy
+
+from learningagent import geometry_helpers
+from learningagent import simulation
+from learningagent import events
+
+class TestEvents(unittest.TestCase):
+
+    def run_episode(self, sink, turns=30):
+        random.seed(0)
+        return simulation.run_episode(turns, geometry_helpers.Point(34, 22), 1000,
+                                      geometry_helpers.Point(5, 5), events=sink)
+
+
+    def test_text_sink(self):
+        # Writes the same log the simulation prints by default
+        printed = io.StringIO()
+        with contextlib.redirect_stdout(printed):
+            self.run_episode(None)
+
+        f = io.StringIO()
+        self.run_episode(events.TextSink(f))
+
+        self.assertEqual(printed.getvalue(), f.getvalue())
+
+        lines = f.getvalue().splitlines()
+        self.assertEqual('Agent starting at point (5, 5)', lines[0])
+        self.assertEqual('Agent goal: (34, 22)', lines[1])
+        self.assertEqual('Final agent location: {}'.format(
+            self.run_episode(events.SilentSink()).final_location), lines[-1])
+
+
+    def test_record_sink(self):
+        sink = events.RecordSink(capacity=16)
+        episode = self.run_episode(sink)
+        records = sink.events
+
+        self.assertEqual(events.EVENT_DTYPE, records.dtype)
+        self.assertEqual(events.STARTED, records[0]['kind'])
+        self.assertEqual((34, 22), (records[0]['target_x'], records[0]['target_y']))
+
+        moved = records[records['kind'] == events.MOVED]
+        self.assertEqual(episode.turns, len(moved))
+        self.assertEqual(list(range(episode.turns)), moved['turn'].tolist())
+        self.assertEqual(episode.final_location,
+                         geometry_helpers.Point(moved[-1]['x'], moved[-1]['y']))
+        self.assertEqual(episode.score, moved[-1]['score'])
+        self.assertTrue(numpy.isnan(moved['belief_x']).all())
+
+        # Written to a file in blocks, the same events are read back
+        f = io.BytesIO()
+        with events.RecordSink(capacity=16, f=f) as file_sink:
+            self.run_episode(file_sink)
+
+        f.seek(0)
+        self.assertEqual(records.tobytes(), events.read_records(f).tobytes())
+
+
+    def test_jsonl_sink(self):
+        f = io.StringIO()
+        sink = events.JSONLSink(f, block_size=10)
+        self.run_episode(sink)
+
+        # Only whole blocks are written until the sink is closed
+        self.assertEqual(0, len(f.getvalue().splitlines()) % 10)
+        sink.close()
+
+        records = events.RecordSink()
+        self.run_episode(records)
+
+        lines = [json.loads(line) for line in f.getvalue().splitlines()]
+        self.assertEqual(len(records.events), len(lines))
+        self.assertEqual({'event': 'started', 'turn': 0, 'location': [5, 5],
+                          'goal': [34, 22]}, lines[0])
+        self.assertEqual([events.EVENT_NAMES[kind] for kind in records.events['kind']],
+                         [line['event'] for line in lines])
+
+
+if __name__ == '__main__':
+    unittest.main()
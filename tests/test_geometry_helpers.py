@@ -1,10 +1,48 @@
+import itertools
+import pickle
 import unittest
 
+import numpy
+
 from learningagent import geometry_helpers
 from learningagent import environment_details
 
 class TestGeometryHelpers(unittest.TestCase):
 
+    def test_point(self):
+        p = geometry_helpers.Point(6, 2)
+
+        self.assertEqual(geometry_helpers.Point(6.0, 2.0), p)
+        self.assertEqual(hash(geometry_helpers.Point(6.0, 2.0)), hash(p))
+        self.assertNotEqual(geometry_helpers.Point(2, 6), p)
+        self.assertNotEqual(None, p)
+        self.assertEqual('(6, 2)', repr(p))
+
+        # Points are immutable
+        with self.assertRaises(AttributeError):
+            p.x = 5
+        with self.assertRaises(AttributeError):
+            p.z = 5
+
+        self.assertEqual(p, pickle.loads(pickle.dumps(p)))
+
+
+    def test_point_array(self):
+        points = [geometry_helpers.Point(1, 2), geometry_helpers.Point(3.5, 4),
+                  geometry_helpers.Point(-1, 0)]
+        array = geometry_helpers.PointArray.from_points(points)
+
+        self.assertEqual(3, len(array))
+        self.assertEqual(points, list(array))
+        self.assertEqual(geometry_helpers.Point(3.5, 4), array[1])
+        self.assertEqual(points[1:], list(array[1:]))
+        self.assertEqual([[1, 2], [3.5, 4], [-1, 0]], array.to_array().tolist())
+        self.assertEqual(array, geometry_helpers.PointArray.from_array(array.to_array()))
+        self.assertEqual('float64', array.x.dtype)
+
+        self.assertRaises(ValueError, geometry_helpers.PointArray, [1, 2], [3])
+
+
     def test_on_segment(self):
         # q clearly on line pr
         p = geometry_helpers.Point(1, 1)
@@ -188,6 +226,24 @@ class TestGeometryHelpers(unittest.TestCase):
 
         self.assertFalse(geometry_helpers.line_is_valid_for_own_obstacle(p, r, obstacle))
 
+        # Test edges are valid in either direction
+        p = geometry_helpers.Point(29, 12)
+        r = geometry_helpers.Point(32, 9)
+        obstacle = environment_details.hexagon
+
+        self.assertTrue(geometry_helpers.line_is_valid_for_own_obstacle(p, r, obstacle))
+        self.assertTrue(geometry_helpers.line_is_valid_for_own_obstacle(r, p, obstacle))
+
+
+    def test_obstacle_topology(self):
+        rectangle = environment_details.rectangle1
+
+        self.assertEqual(4, len(rectangle.vertices))
+        self.assertIn(geometry_helpers.Point(18, 10), rectangle.vertices)
+        self.assertIn(frozenset([geometry_helpers.Point(6, 2),
+                                 geometry_helpers.Point(6, 10)]), rectangle.edges)
+        self.assertEqual((6, 2, 18, 10), rectangle.bounds)
+
 
     def test_point_in_any_obstacle(self):
         # Test point clearly inside obstacle
@@ -208,6 +264,48 @@ class TestGeometryHelpers(unittest.TestCase):
 
         self.assertFalse(geometry_helpers.point_in_any_obstacle(p, obstacles))
 
+    def test_point_in_obstacle(self):
+        from matplotlib.path import Path
+
+        # Grid of points, including many on obstacle edges and vertices,
+        # classified the same as by a matplotlib path of the obstacle
+        points = [geometry_helpers.Point(x / 2, y / 2)
+                  for x in range(-2, 84) for y in range(-2, 54)]
+
+        for obstacle in environment_details.visible_obstacles:
+            path = Path(obstacle.vertex_array)
+            for p in points:
+                self.assertEqual(path.contains_point((p.x, p.y)),
+                                 geometry_helpers.point_in_obstacle(p, obstacle))
+
+
+    def test_points_in_obstacles(self):
+        obstacles = environment_details.visible_obstacles
+
+        # Grid of points, including many on obstacle edges and vertices
+        points = [geometry_helpers.Point(x / 2, y / 2)
+                  for x in range(-2, 84) for y in range(-2, 54)]
+
+        inside = geometry_helpers.points_in_obstacles(points, obstacles, chunk_size=500)
+
+        self.assertEqual(len(points), len(inside))
+        self.assertEqual([geometry_helpers.point_in_any_obstacle(p, obstacles)
+                          for p in points],
+                         inside.tolist())
+
+        # Points can be given as a PointArray or (N, 2) array
+        array = geometry_helpers.PointArray.from_points(points)
+
+        self.assertEqual(inside.tolist(),
+                         geometry_helpers.points_in_obstacles(array, obstacles).tolist())
+        self.assertEqual([True, False], geometry_helpers.points_in_obstacles(
+            numpy.array([[8, 8], [5, 5]]), obstacles).tolist())
+
+        self.assertEqual([], geometry_helpers.points_in_obstacles([], obstacles).tolist())
+        self.assertEqual([False], geometry_helpers.points_in_obstacles(
+            [geometry_helpers.Point(8, 8)], []).tolist())
+
+
     def test_obstacle_inside_area(self):
         # Test obstacle clearly inside area
         p = geometry_helpers.Point(23, 9)
@@ -267,5 +365,60 @@ class TestGeometryHelpers(unittest.TestCase):
                         "Line should intersect along obstacle's edge.")
 
 
+    def test_pack_edges(self):
+        edges = geometry_helpers.pack_edges([environment_details.rectangle1,
+                                             environment_details.triangle1])
+
+        self.assertEqual((7, 4), edges.shape)
+        self.assertEqual('float64', edges.dtype)
+        self.assertEqual([6, 2, 18, 2], list(edges[0]))
+        self.assertEqual([14.5, 21, 13, 14], list(edges[6]))
+
+        self.assertEqual((0, 4), geometry_helpers.pack_edges([]).shape)
+
+
+    def test_pack_bounds(self):
+        bounds = geometry_helpers.pack_bounds([environment_details.rectangle1,
+                                               geometry_helpers.Obstacle([]),
+                                               environment_details.triangle1])
+
+        self.assertEqual((3, 4), bounds.shape)
+        self.assertEqual(list(environment_details.rectangle1.bounds), list(bounds[0]))
+        self.assertTrue(numpy.isnan(bounds[1]).all())
+        self.assertEqual(list(environment_details.triangle1.bounds), list(bounds[2]))
+
+        self.assertEqual((0, 4), geometry_helpers.pack_bounds([]).shape)
+
+
+    def test_segments_intersect(self):
+        # Every combination of segments between a handful of points,
+        # including colinear and touching segments
+        points = [geometry_helpers.Point(x, y)
+                  for x, y in [(1, 1), (2, 2), (3, 3), (1, 3), (3, 1), (2, 1), (4, 4)]]
+
+        for p1, q1, p2, q2 in itertools.product(points, repeat=4):
+            self.assertEqual(geometry_helpers.do_intersect(p1, q1, p2, q2),
+                             bool(geometry_helpers.segments_intersect(
+                                 p1.x, p1.y, q1.x, q1.y, p2.x, p2.y, q2.x, q2.y)))
+
+
+    def test_segment_blocked(self):
+        obstacles = environment_details.visible_obstacles
+        edges = geometry_helpers.pack_edges(obstacles)
+        vertices = [line[0] for obstacle in obstacles for line in obstacle.lines]
+        points = vertices + [geometry_helpers.Point(5, 5), geometry_helpers.Point(10, 2),
+                             geometry_helpers.Point(34, 22), geometry_helpers.Point(20, 16)]
+
+        for p in points:
+            for r in vertices:
+                self.assertEqual(any(geometry_helpers.obstacle_blocks_line(p, r, O)
+                                     for O in obstacles),
+                                 geometry_helpers.segment_blocked(p, r, edges))
+
+        self.assertFalse(geometry_helpers.segment_blocked(
+            geometry_helpers.Point(1, 1), geometry_helpers.Point(2, 2),
+            geometry_helpers.pack_edges([])))
+
+
 if __name__ == '__main__':
     unittest.main()
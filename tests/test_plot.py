@@ -0,0 +1,83 @@
+import io
+import random
+import unittest
+
+import numpy
+
+from learningagent import geometry_helpers
+from learningagent import environment_details
+from learningagent import simulation
+from learningagent import events
+from learningagent import plot
+
+class FrameCollector():
+    """
+    Stands in for an FFmpegWriter, keeping a copy of each frame.
+    """
+
+    def __init__(self):
+        self.frames = []
+        self.closed = False
+
+
+    def write(self, frame):
+        self.frames.append(numpy.array(frame))
+
+
+    def close(self):
+        self.closed = True
+
+
+class TestPlot(unittest.TestCase):
+
+    def run_episode(self, sink, turns=40):
+        random.seed(0)
+        return simulation.run_episode(turns, geometry_helpers.Point(9, 3), 1000,
+                                      geometry_helpers.Point(5, 5), events=sink)
+
+
+    def test_replay_log(self):
+        # Replaying a log reports the same events as the simulation did
+        log = io.StringIO()
+        self.run_episode(events.TextSink(log))
+
+        direct = events.RecordSink()
+        self.run_episode(direct)
+
+        replayed = events.RecordSink()
+        log.seek(0)
+        plot.replay_log(log, replayed)
+
+        self.assertIn(events.REACHED_GOAL, direct.events['kind'])
+        for field in events.EVENT_DTYPE.names:
+            numpy.testing.assert_array_equal(direct.events[field],
+                                             replayed.events[field])
+
+
+    def test_frame_renderer(self):
+        recorder = events.RecordSink()
+        self.run_episode(recorder)
+
+        output = FrameCollector()
+        with plot.FrameRenderer(environment_details.visible_obstacles,
+                                output) as renderer:
+            self.run_episode(renderer)
+
+        self.assertTrue(output.closed)
+        self.assertEqual((840, 700), renderer.width_height)
+
+        # One frame per event, each a full RGBA image
+        self.assertEqual(len(recorder.events), len(output.frames))
+        for frame in output.frames:
+            self.assertEqual((700, 840, 4), frame.shape)
+            self.assertEqual(numpy.uint8, frame.dtype)
+
+        # The frame is read straight from the canvas
+        numpy.testing.assert_array_equal(output.frames[-1], renderer.frame())
+
+        # The agent moves, so its frames differ
+        self.assertFalse(numpy.array_equal(output.frames[1], output.frames[-1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
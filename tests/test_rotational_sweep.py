@@ -0,0 +1,83 @@
+import unittest
+
+from learningagent import geometry_helpers
+from learningagent import environment_details
+from learningagent import agent_percepts as percepts
+from learningagent import rotational_sweep
+
+class TestRotationalSweep(unittest.TestCase):
+
+    def test_edge_status(self):
+        status = rotational_sweep.EdgeStatus()
+
+        def less(e1, e2):
+            return e1 < e2
+
+        for edge in [5, 3, 8, 1, 4, 7, 9, 2, 6]:
+            status.insert(edge, less)
+
+        self.assertEqual([1, 2, 3, 4, 5, 6, 7, 8, 9], list(status))
+
+        status.remove(4, less)
+        status.remove(1, less)
+        status.remove(9, less)
+
+        self.assertEqual([2, 3, 5, 6, 7, 8], list(status))
+        self.assertEqual(6, len(status))
+
+        self.assertRaises(KeyError, status.remove, 10, less)
+
+
+    def test_visible_vertices(self):
+        visible_obstacles = environment_details.visible_obstacles
+
+        # Test upper-right corner (open space)
+        p = geometry_helpers.Point(34, 22)
+
+        self.assertEqual([geometry_helpers.Point(32, 23), geometry_helpers.Point(35, 21)],
+                         rotational_sweep.visible_vertices(p, visible_obstacles))
+
+        # Test far-right vertex of pentagon
+        p = geometry_helpers.Point(12, 19)
+
+        self.assertEqual(set([geometry_helpers.Point(8.5, 23), geometry_helpers.Point(14.5, 21),
+                              geometry_helpers.Point(10, 14), geometry_helpers.Point(13, 14)]),
+                         set(rotational_sweep.visible_vertices(p, visible_obstacles)))
+
+
+    def test_matches_legacy_visible_vertices(self):
+        visible_obstacles = environment_details.visible_obstacles
+
+        points = [geometry_helpers.Point(x, y)
+                  for x in range(-1, environment_details.x_bounds + 2)
+                  for y in range(-1, environment_details.y_bounds + 2)]
+        points.extend(line[0] for obstacle in visible_obstacles
+                      for line in obstacle.lines)
+        # Points lying on obstacle edges and on rays through several vertices
+        points.extend([geometry_helpers.Point(12, 2), geometry_helpers.Point(6, 6),
+                       geometry_helpers.Point(8.5, 19), geometry_helpers.Point(29, 7.5)])
+
+        for p in points:
+            self.assertEqual(percepts.visible_vertices(p, visible_obstacles, 'legacy'),
+                             rotational_sweep.visible_vertices(p, visible_obstacles))
+
+
+    def test_collinear_vertices(self):
+        # Three squares in a row, so rays from p pass through several vertices
+        def square(x, y):
+            corners = [geometry_helpers.Point(x, y), geometry_helpers.Point(x + 2, y),
+                       geometry_helpers.Point(x + 2, y + 2), geometry_helpers.Point(x, y + 2)]
+            return geometry_helpers.Obstacle([[corners[i], corners[(i + 1) % 4]]
+                                              for i in range(4)])
+
+        obstacles = [square(0, 0), square(4, 0), square(8, 0), square(4, 4)]
+
+        for p in [geometry_helpers.Point(-2, 0), geometry_helpers.Point(-2, 2),
+                  geometry_helpers.Point(3, 1), geometry_helpers.Point(2, 2),
+                  geometry_helpers.Point(7, 3), geometry_helpers.Point(14, 6)]:
+            self.assertEqual(percepts.visible_vertices(p, obstacles, 'legacy'),
+                             rotational_sweep.visible_vertices(p, obstacles))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import concurrent.futures
+import multiprocessing
+import os
+import tempfile
+import unittest
+
+import numpy
+
+from learningagent import geometry_helpers
+from learningagent import environment_details
+from learningagent import agent_percepts as percepts
+from learningagent import shared_environment
+from learningagent.environment import Environment
+
+
+def shifted_environment(dx):
+    """
+    Return the example maze moved dx to the right, so its caches haven't
+    been built yet in any process.
+    """
+    obstacles = [geometry_helpers.Obstacle(
+        [[geometry_helpers.Point(p.x + dx, p.y) for p in line]
+         for line in obstacle.lines])
+        for obstacle in environment_details.visible_obstacles]
+
+    return Environment(obstacles, 40 + dx, 25)
+
+
+def worker_neighbours(handle, p):
+    environment = shared_environment.attach(handle)
+    graph = percepts.visibility_graph(environment)
+
+    # Shared arrays are read-only, ones built in this process aren't
+    return (percepts.actions(p, environment), graph.targets.flags.writeable,
+            percepts.distance_matrix(environment).matrix.flags.writeable)
+
+
+class TestSharedEnvironment(unittest.TestCase):
+
+    def check_attached(self, published, environment):
+        self.assertEqual(published.key, environment.key)
+        self.assertEqual(list(published), list(environment))
+        self.assertTrue(numpy.array_equal(published.edges, environment.edges))
+        self.assertFalse(environment.edges.flags.writeable)
+
+
+    def test_shared_memory(self):
+        published = shifted_environment(100)
+        p = geometry_helpers.Point(106, 2)
+        graph = percepts.visibility_graph(published)
+
+        with shared_environment.SharedEnvironment(published) as shared:
+            context = multiprocessing.get_context('spawn')
+
+            with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as pool:
+                actions, graph_writeable, matrix_writeable = pool.submit(
+                    worker_neighbours, shared.handle, p).result()
+
+        self.assertEqual(graph.neighbours(p), actions)
+        self.assertFalse(graph_writeable)
+        self.assertFalse(matrix_writeable)
+
+
+    def test_file(self):
+        published = shifted_environment(200)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'maze.bin')
+            shared = shared_environment.SharedEnvironment(published, path)
+
+            environment = shared_environment.attach(shared.handle)
+            self.check_attached(published, environment)
+            self.assertIs(environment, shared_environment.attach(shared.handle))
+
+            matrix = percepts.distance_matrix(environment)
+            self.assertEqual(12, matrix.distance(geometry_helpers.Point(206, 2),
+                                                 geometry_helpers.Point(218, 2)))
+
+            shared.unlink()
+            self.assertFalse(os.path.exists(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
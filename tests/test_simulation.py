@@ -1,8 +1,11 @@
+import itertools
 import unittest
 
 from learningagent import geometry_helpers
 from learningagent import environment_details
 from learningagent import simulation
+from learningagent import events
+from learningagent.environment import Environment
 
 class TestSimulation(unittest.TestCase):
 
@@ -16,5 +19,79 @@ class TestSimulation(unittest.TestCase):
             number_of_turns, goal_point, goal_reward, initial_location))
 
 
+    def test_run_simulation_environment(self):
+        # A different maze in the same process, with only two obstacles
+        environment = Environment([environment_details.rectangle1,
+                                   environment_details.hexagon], 40, 25)
+        goal_point = geometry_helpers.Point(34, 22)
+        initial_location = geometry_helpers.Point(5, 5)
+
+        self.assertTrue(simulation.run_simulation(
+            20, goal_point, 1000, initial_location, environment=environment))
+
+
+    def test_run_episode_without_bounds(self):
+        # The goal is reset inside the extent of the obstacles
+        goal_point = geometry_helpers.Point(9, 3)
+        initial_location = geometry_helpers.Point(5, 5)
+        obstacles = environment_details.visible_obstacles
+
+        for environment in [Environment(obstacles), list(obstacles)]:
+            episode = simulation.run_episode(40, goal_point, 1000, initial_location,
+                                             environment=environment,
+                                             events=events.SilentSink())
+
+            self.assertGreater(episode.goals_reached, 0)
+            self.assertLessEqual(episode.final_location.x, 35)
+            self.assertLessEqual(episode.final_location.y, 23)
+
+
+    def test_run_episode(self):
+        goal_point = geometry_helpers.Point(34, 22)
+        initial_location = geometry_helpers.Point(5, 5)
+
+        episode = simulation.run_episode(40, goal_point, 1000, initial_location)
+
+        self.assertEqual(40, episode.turns)
+        self.assertEqual(0, episode.goals_reached)
+        self.assertEqual(None, episode.first_goal_turn)
+        self.assertLess(episode.score, 0)
+
+
+    def test_simulate_steps(self):
+        goal_point = geometry_helpers.Point(34, 22)
+        initial_location = geometry_helpers.Point(5, 5)
+        steps = simulation.simulate_steps(30, goal_point, 1000, initial_location)
+
+        taken = []
+        while True:
+            try:
+                taken.append(next(steps))
+            except StopIteration as finished:
+                episode = finished.value
+                break
+
+        self.assertEqual(simulation.run_episode(30, goal_point, 1000, initial_location,
+                                                events=events.SilentSink()),
+                         episode)
+        self.assertEqual(list(range(30)), [step.turn for step in taken])
+        self.assertEqual(initial_location, taken[0].belief)
+        self.assertEqual(taken[0].action, taken[0].location)
+        self.assertEqual(episode.final_location, taken[-1].location)
+        self.assertEqual(episode.score, taken[-1].score)
+
+        # Stopping early stops the simulation, and nothing more is reported
+        sink = events.RecordSink()
+        steps = simulation.simulate_steps(30, goal_point, 1000, initial_location,
+                                          events=sink)
+        first = list(itertools.islice(steps, 5))
+        steps.close()
+
+        self.assertEqual([step[:-1] for step in taken[:5]],
+                         [step[:-1] for step in first])
+        self.assertEqual(5, (sink.events['kind'] == events.MOVED).sum())
+        self.assertNotIn(events.FAILED, sink.events['kind'])
+
+
 if __name__ == "__main__":
     unittest.main()
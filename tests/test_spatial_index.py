@@ -0,0 +1,136 @@
+import unittest
+
+import numpy
+
+from learningagent import geometry_helpers
+from learningagent import environment_details
+from learningagent import spatial_index
+
+class TestSpatialIndex(unittest.TestCase):
+
+    def setUp(self):
+        # 3x3 grid of unit cells covering (0, 0) to (3, 3)
+        self.edges = numpy.array([[0, 0, 3, 0], [3, 0, 3, 3],
+                                  [3, 3, 0, 3], [0, 3, 0, 0],
+                                  [1, 1, 2, 1]], dtype=numpy.float64)
+        self.grid = spatial_index.EdgeGrid(self.edges, cell_size=1)
+
+
+    def test_cells(self):
+        self.assertEqual((4, 4), (self.grid.columns, self.grid.rows))
+
+        # Edge along a cell boundary is in the cells on both sides
+        self.assertIn(4, self.grid.cells[(1, 0)])
+        self.assertIn(4, self.grid.cells[(1, 1)])
+        self.assertNotIn(4, self.grid.cells.get((1, 2), []))
+
+
+    def test_cells_crossed(self):
+        # Horizontal line
+        p = geometry_helpers.Point(0.5, 0.5)
+        r = geometry_helpers.Point(2.5, 0.5)
+
+        self.assertEqual([(0, 0), (1, 0), (2, 0)], self.grid.cells_crossed(p, r))
+
+        # Vertical line, backwards
+        p = geometry_helpers.Point(1.5, 2.5)
+        r = geometry_helpers.Point(1.5, 0.5)
+
+        self.assertEqual([(1, 2), (1, 1), (1, 0)], self.grid.cells_crossed(p, r))
+
+        # Diagonal line passing through cell corners
+        p = geometry_helpers.Point(0.5, 0.5)
+        r = geometry_helpers.Point(2.5, 2.5)
+
+        self.assertEqual([(0, 0), (1, 0), (0, 1), (1, 1), (2, 1), (1, 2), (2, 2)],
+                         self.grid.cells_crossed(p, r))
+
+        # Shallow line
+        p = geometry_helpers.Point(0.5, 0.5)
+        r = geometry_helpers.Point(2.5, 1.2)
+
+        self.assertEqual([(0, 0), (1, 0), (1, 1), (2, 1)],
+                         self.grid.cells_crossed(p, r))
+
+        # Line starting outside the grid is clipped to it
+        p = geometry_helpers.Point(-10, 0.5)
+        r = geometry_helpers.Point(0.5, 0.5)
+
+        self.assertEqual([(0, 0)], self.grid.cells_crossed(p, r))
+
+        # Line missing the grid entirely
+        p = geometry_helpers.Point(-10, -10)
+        r = geometry_helpers.Point(-5, 10)
+
+        self.assertEqual([], self.grid.cells_crossed(p, r))
+
+
+    def test_candidate_edges(self):
+        obstacles = environment_details.visible_obstacles
+        edges = geometry_helpers.pack_edges(obstacles)
+        index = spatial_index.ObstacleIndex(obstacles, edges, cell_size=2)
+        vertices = [line[0] for obstacle in obstacles for line in obstacle.lines]
+        points = vertices + [geometry_helpers.Point(x, y) for x in range(0, 41, 5)
+                             for y in range(0, 26, 5)]
+
+        # Every edge the line crosses is a candidate
+        for p in points:
+            for r in vertices:
+                candidates = set(index.candidate_edges(p, r))
+
+                for i, (x1, y1, x2, y2) in enumerate(edges):
+                    if geometry_helpers.do_intersect(p, r, geometry_helpers.Point(x1, y1),
+                                                     geometry_helpers.Point(x2, y2)):
+                        self.assertIn(i, candidates)
+
+        # Short line in open space has no candidates
+        p = geometry_helpers.Point(1, 1)
+        r = geometry_helpers.Point(2, 1)
+
+        self.assertEqual([], list(index.candidate_edges(p, r)))
+
+
+    def test_obstacles_containing(self):
+        obstacles = environment_details.visible_obstacles
+        index = spatial_index.ObstacleIndex(obstacles,
+                                            geometry_helpers.pack_edges(obstacles))
+
+        self.assertEqual((len(obstacles), 4), index.bounds.shape)
+        self.assertEqual([6, 2, 18, 10], list(index.bounds[0]))
+
+        # Both points are vertices of rectangle1
+        p = geometry_helpers.Point(6, 2)
+        r = geometry_helpers.Point(18, 10)
+
+        self.assertEqual([0], list(index.obstacles_containing(p, r)))
+
+        # Points on different obstacles
+        r = geometry_helpers.Point(35, 21)
+
+        self.assertEqual([], list(index.obstacles_containing(p, r)))
+
+
+    def test_point_hash(self):
+        points = [geometry_helpers.Point(8.5, 14.5),
+                  geometry_helpers.Point(0, 0),
+                  geometry_helpers.Point(-3, 2)]
+        index = spatial_index.PointHash(points, tolerance=1e-6)
+
+        self.assertEqual(3, len(index))
+        self.assertEqual(0, index.find(8.5, 14.5))
+        self.assertEqual(2, index.find(-3, 2))
+
+        # Points within tolerance are found, including from the
+        # neighbouring buckets
+        self.assertEqual(0, index.find(8.5 + 4e-7, 14.5 - 4e-7))
+        self.assertEqual(1, index.find(-1e-12, 1e-12))
+        self.assertEqual(1, index.find(1e-6, -1e-6))
+        self.assertIn(geometry_helpers.Point(0.1 + 0.2 - 0.3, 0), index)
+
+        # Points further away are not
+        self.assertIsNone(index.find(8.5 + 2e-6, 14.5))
+        self.assertNotIn(geometry_helpers.Point(0, 3e-6), index)
+
+
+if __name__ == "__main__":
+    unittest.main()